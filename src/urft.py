@@ -0,0 +1,272 @@
+import os
+import io
+import sys
+import time
+import asyncio
+import argparse
+import threading
+import contextlib
+import concurrent.futures
+
+from urft_client import TCPficationClient, ChunkCompressor
+from urft_server import TCPficationServer
+
+# Library entry points: send from memory, iterators, file objects or pipes, and receive into
+# callbacks, writable streams or async iterators, without staging anything on disk. Extra keyword
+# arguments go to TCPficationClient (cc_mode, fec, compress, ...) or TCPficationServer.
+
+class TransferError(Exception):
+    pass
+
+class Transfer:
+    # One received transfer and, once it ends, its outcome
+
+    def __init__(self, name, sender_addr) -> None:
+        self.name: str = name
+        self.sender_addr = sender_addr
+        self.size = 0  # bytes handed to the consumer
+        self.verified: bool | None = None  # Digest comparison at EOF, None if the client sent no digest
+        self.error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.verified is not False
+
+def open_source(source):
+    # "-" is standard input, text streams are read through their binary buffer
+    if isinstance(source, str) and source == "-":
+        return sys.stdin.buffer
+    if isinstance(source, io.TextIOBase):
+        return source.buffer
+    return source
+
+def send(source, host, port, name="stream", **client_options) -> None:
+    # source: bytes, an iterable of bytes, a binary file object or pipe, "-" for stdin, or a path
+    client = TCPficationClient(host, port, **client_options)
+    try:
+        if isinstance(source, os.PathLike) or (isinstance(source, str) and source != "-"):
+            sent = client.send_files([os.fspath(source)])
+        else:
+            sent = client.send_stream(open_source(source), name)
+    finally:
+        client.close()
+    if not sent:
+        raise TransferError(f"Sending {name} to {host}:{port} failed")
+
+def iterate_async(aiterable, loop):
+    # Blocking iterator over an async iterable that runs on `loop`, for use from another thread
+    iterator = aiter(aiterable)
+
+    async def step():
+        return await anext(iterator)
+
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(step(), loop).result()
+        except StopAsyncIteration:
+            return
+
+async def send_async(source, host, port, name="stream", **client_options) -> None:
+    # send() on a worker thread; the source may also be an async iterable of bytes
+    if hasattr(source, "__aiter__"):
+        source = iterate_async(source, asyncio.get_running_loop())
+    await asyncio.to_thread(send, source, host, port, name, **client_options)
+
+class StreamSink:
+    # The server's sink for one transfer: forwards chunks to the consumer and records the outcome.
+    # A consumer that raises gets no more data, and the transfer is reported as failed.
+
+    def __init__(self, receiver, transfer, consumer) -> None:
+        self.receiver: Receiver = receiver
+        self.transfer: Transfer = transfer
+        self.consumer = consumer
+        self.write_chunk = consumer.write if hasattr(consumer, "write") else consumer
+        if not callable(self.write_chunk):
+            raise TypeError(f"A consumer must be callable or have write(), not {type(consumer).__name__}")
+
+    def write(self, data) -> None:
+        if self.transfer.error is not None:
+            return
+        try:
+            self.write_chunk(data)
+            self.transfer.size += len(data)
+        except Exception as e:
+            self.transfer.error = f"consumer failed: {e!r}"
+
+    def finish(self, verified) -> None:
+        self.transfer.verified = verified
+        if verified is False and self.transfer.error is None:
+            self.transfer.error = "integrity check failed: digest does not match the client's"
+        flush = getattr(self.consumer, "flush", None)
+        if flush is not None and self.transfer.error is None:
+            flush()
+        self.receiver.completed(self.transfer)
+
+    def abort(self, reason) -> None:
+        self.transfer.error = reason
+        self.receiver.completed(self.transfer)
+
+class Receiver:
+    # Runs a TCPficationServer on a background thread and hands every transfer to a consumer
+    # instead of a file. open_consumer(transfer) returns a callable taking each chunk, in order,
+    # or a writable binary stream. Consumers run on the server's thread, so a slow one holds back
+    # the ACKs and with them the sender.
+    MAX_SESSIONS: int = 1  # Transfers at a time, further senders are told the server is busy
+    LINGER: float = 1.0  # seconds to keep answering EOF retries after a transfer completes
+
+    def __init__(self, open_consumer, host="0.0.0.0", port=6969, on_complete=None, **server_options) -> None:
+        server_options.setdefault("max_sessions", self.MAX_SESSIONS)
+        self.open_consumer = open_consumer
+        self.on_complete = on_complete  # Called with each finished Transfer, on the server's thread
+        self.server: TCPficationServer = TCPficationServer(host, port, sink_factory=self.open_sink, **server_options)
+        self.transfers = []  # Finished transfers, in completion order
+        self.completed_time: float = 0.0
+        self.condition = threading.Condition()
+        self.thread: threading.Thread | None = None
+
+    @property
+    def port(self) -> int:
+        return self.server.port
+
+    def start(self):
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.listen, name="urft-receiver", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        linger = self.completed_time + self.LINGER - time.time()
+        if linger > 0:
+            time.sleep(linger)
+        self.server.stop()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.server.server_socket.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def open_sink(self, filename, sender_addr) -> StreamSink:
+        transfer = Transfer(filename, sender_addr)
+        return StreamSink(self, transfer, self.open_consumer(transfer))
+
+    def completed(self, transfer) -> None:
+        with self.condition:
+            self.transfers.append(transfer)
+            self.completed_time = time.time()
+            self.condition.notify_all()
+        if self.on_complete is not None:
+            self.on_complete(transfer)
+
+    def wait(self, count=1, timeout=None) -> list:
+        # The first `count` finished transfers, waiting for them if needed
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.transfers) >= count, timeout):
+                raise TimeoutError(f"{len(self.transfers)} of {count} transfers finished in {timeout} seconds")
+            return self.transfers[:count]
+
+def receive(consumer, host="0.0.0.0", port=6969, count=1, timeout=None, **server_options) -> list:
+    # Receive `count` transfers into a callable or writable binary stream ("-" for stdout) and return
+    # them as Transfers; raises TransferError if any failed
+    if isinstance(consumer, str) and consumer == "-":
+        consumer = sys.stdout.buffer
+    with Receiver(lambda transfer: consumer, host, port, **server_options) as receiver:
+        transfers = receiver.wait(count, timeout)
+    failed = [transfer for transfer in transfers if not transfer.ok]
+    if failed:
+        raise TransferError(f"{failed[0].name} from {failed[0].sender_addr}: {failed[0].error}")
+    return transfers
+
+async def receive_async(consumer, host="0.0.0.0", port=6969, count=1, timeout=None, **server_options) -> list:
+    # receive() on a worker thread
+    return await asyncio.to_thread(receive, consumer, host, port, count, timeout, **server_options)
+
+class AsyncReceiver:
+    # Async context manager over a Receiver: each `async for chunk in receiver` loop yields the
+    # chunks of the next transfer and ends with it, raising TransferError if it failed.
+    # The queue is bounded, so a consumer that falls behind slows the sender down.
+    QUEUE_SIZE: int = 256  # chunks
+
+    def __init__(self, host="0.0.0.0", port=6969, queue_size=None, **server_options) -> None:
+        self.queue_size: int = queue_size or self.QUEUE_SIZE
+        self.receiver: Receiver = Receiver(lambda transfer: self.put, host, port, on_complete=self.put, **server_options)
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.queue: asyncio.Queue | None = None
+        self.closed = False
+        self.transfer: Transfer | None = None  # The last transfer iterated to its end
+
+    @property
+    def port(self) -> int:
+        return self.receiver.port
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.queue_size)
+        self.receiver.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.closed = True  # Releases a server thread waiting on a full queue
+        await asyncio.to_thread(self.receiver.stop)
+
+    def put(self, item) -> None:
+        # Server thread: a chunk, or the finished Transfer that ends its chunks
+        if self.closed:
+            return
+        future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop)
+        while not self.closed:
+            try:
+                return future.result(0.1)
+            except concurrent.futures.TimeoutError:
+                continue
+        future.cancel()
+
+    def __aiter__(self):
+        return self.chunks()
+
+    async def chunks(self):
+        while True:
+            item = await self.queue.get()
+            if isinstance(item, Transfer):
+                self.transfer = item
+                if not item.ok:
+                    raise TransferError(f"{item.name} from {item.sender_addr}: {item.error}")
+                return
+            yield item
+
+def main():
+    # Pipe helpers: `... | urft.py send HOST PORT` and `urft.py receive [HOST] [PORT] | ...`
+    parser = argparse.ArgumentParser(description="Stream standard input to a server, or a received transfer to standard output")
+    commands = parser.add_subparsers(dest="command", required=True)
+    send_parser = commands.add_parser("send", help="Send standard input")
+    send_parser.add_argument("server_ip")
+    send_parser.add_argument("server_port", type=int)
+    send_parser.add_argument("--name", default="stream", help="Name announced to the server (default: %(default)s)")
+    send_parser.add_argument("--compress", choices=["auto"] + ChunkCompressor.available(),
+                             help="Compress chunks that shrink, with the given codec or the best one both sides support")
+    receive_parser = commands.add_parser("receive", help="Write received transfers to standard output")
+    receive_parser.add_argument("host", nargs="?", default="0.0.0.0")
+    receive_parser.add_argument("port", nargs="?", type=int, default=6969)
+    receive_parser.add_argument("--count", type=int, default=1, help="Transfers to receive (default: %(default)s)")
+    args = parser.parse_args()
+
+    # Status output goes to stderr, stdout may be the data
+    stdout = sys.stdout.buffer
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            if args.command == "send":
+                send("-", args.server_ip, args.server_port, args.name, compress=args.compress)
+            else:
+                receive(stdout, args.host, args.port, args.count)
+        except TransferError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            sys.exit(130)
+
+if __name__ == "__main__":
+    main()
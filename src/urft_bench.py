@@ -0,0 +1,460 @@
+import socket
+import os
+import sys
+import time
+import json
+import heapq
+import random
+import argparse
+import selectors
+import threading
+import subprocess
+import tempfile
+import filecmp
+import statistics
+import platform
+import re
+import struct
+
+from urft_protocol import set_buffer
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+CLIENT = os.path.join(SRC_DIR, "urft_client.py")
+SERVER = os.path.join(SRC_DIR, "urft_server.py")
+
+# Named impairment profiles. Times are in seconds, rates in bytes per second, probabilities per packet.
+PROFILES = {
+    "clean": {},
+    "lan": {"delay": 0.0005, "jitter": 0.0002, "rate": 125_000_000},
+    "lossy": {"delay": 0.005, "jitter": 0.001, "loss": 0.01},
+    "wan": {"delay": 0.02, "jitter": 0.003, "loss": 0.002, "rate": 6_250_000},
+    "reorder": {"delay": 0.005, "jitter": 0.002, "reorder": 0.05, "reorder_delay": 0.01},
+    "hostile": {"delay": 0.01, "jitter": 0.005, "loss": 0.05, "duplicate": 0.01, "reorder": 0.05,
+                "reorder_delay": 0.02, "rate": 2_500_000},
+}
+
+class ImpairedLink:
+    # One direction of the emulated path: a drop-tail bottleneck queue drained at `rate`, then
+    # propagation delay with jitter, random loss, duplication and occasional extra delay that
+    # reorders packets. All randomness comes from the seeded generator, so runs are repeatable.
+    FIELDS = ("loss", "delay", "jitter", "reorder", "reorder_delay", "duplicate", "rate", "queue")
+    DEFAULT_QUEUE: float = 0.05  # seconds of traffic the bottleneck queue holds before dropping
+
+    def __init__(self, profile, rng) -> None:
+        unknown = set(profile) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown impairment: {', '.join(sorted(unknown))} (choose from {', '.join(self.FIELDS)})")
+        self.loss: float = profile.get("loss", 0.0)
+        self.delay: float = profile.get("delay", 0.0)
+        self.jitter: float = profile.get("jitter", 0.0)
+        self.reorder: float = profile.get("reorder", 0.0)
+        self.reorder_delay: float = profile.get("reorder_delay", 0.01)
+        self.duplicate: float = profile.get("duplicate", 0.0)
+        self.rate: float | None = profile.get("rate")
+        self.queue: float = profile.get("queue", self.DEFAULT_QUEUE)
+        self.rng = rng
+        self.link_free: float = 0.0  # When the bottleneck finishes sending what is already queued
+        self.forwarded = 0
+        self.dropped = 0
+        self.duplicated = 0
+
+    def schedule(self, now, size) -> list:
+        # Delivery times for one packet: none if it is lost, two if it is duplicated
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+            return []
+        departure = now
+        if self.rate:
+            start = max(now, self.link_free)
+            if start - now > self.queue:
+                self.dropped += 1  # Queue full
+                return []
+            self.link_free = start + size / self.rate
+            departure = self.link_free
+        copies = 2 if self.rng.random() < self.duplicate else 1
+        self.duplicated += copies - 1
+        deliveries = []
+        for _ in range(copies):
+            arrival = departure + self.delay + self.rng.uniform(0, self.jitter)
+            if self.rng.random() < self.reorder:
+                arrival += self.reorder_delay
+            deliveries.append(arrival)
+        self.forwarded += 1
+        return deliveries
+
+class LossyProxy:
+    # UDP proxy between client and server. Every client address gets its own upstream socket,
+    # so the server still sees one flow per client. Its sockets get buffers as large as the
+    # client's and server's, and datagrams the kernel drops on them count as link drops, so the
+    # numbers describe the emulated path and not the proxy.
+    BUFFER_SIZE: int = 65535
+    SOCKET_BUFFER: int = 4 * 1024 * 1024  # bytes, what urft_client.py and urft_server.py request
+    SO_RXQ_OVFL: int = getattr(socket, "SO_RXQ_OVFL", 40)  # Linux: receive-queue drop counter
+
+    def __init__(self, server_addr, profile, seed=1, host="127.0.0.1") -> None:
+        self.server_addr = server_addr
+        rng = random.Random(seed)
+        self.uplink: ImpairedLink = ImpairedLink(profile, random.Random(rng.random()))
+        self.downlink: ImpairedLink = ImpairedLink(profile, random.Random(rng.random()))
+        self.overflows = {}  # socket -> kernel drop count last reported by SO_RXQ_OVFL
+        self.front: socket.socket = self.make_socket()
+        self.front.bind((host, 0))
+        self.port: int = self.front.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.front, selectors.EVENT_READ)
+        self.upstreams = {}  # client address -> socket connected to the server
+        self.clients = {}  # upstream socket -> client address
+        self.events = []  # Min-heap of (delivery time, order, link, socket, data, address)
+        self.order = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="urft-bench-proxy", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        for sock in [self.front, *self.upstreams.values()]:
+            sock.close()
+        self.selector.close()
+
+    def make_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        set_buffer(sock, socket.SO_RCVBUF, self.SOCKET_BUFFER)
+        set_buffer(sock, socket.SO_SNDBUF, self.SOCKET_BUFFER)
+        if sys.platform.startswith("linux"):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, self.SO_RXQ_OVFL, 1)
+                self.overflows[sock] = 0
+            except OSError:
+                pass  # Overflow drops go uncounted
+        return sock
+
+    def receive(self, sock, link):
+        # One datagram and its sender; kernel drops reported since the last read count against `link`
+        if sock in self.overflows:
+            data, ancdata, _, addr = sock.recvmsg(self.BUFFER_SIZE, socket.CMSG_SPACE(4))
+            for level, kind, value in ancdata:
+                if level == socket.SOL_SOCKET and kind == self.SO_RXQ_OVFL:
+                    total = struct.unpack("=I", value[:4])[0]
+                    link.dropped += (total - self.overflows[sock]) & 0xFFFFFFFF
+                    self.overflows[sock] = total
+            return data, addr
+        return sock.recvfrom(self.BUFFER_SIZE)
+
+    def upstream(self, client_addr) -> socket.socket:
+        sock = self.upstreams.get(client_addr)
+        if sock is None:
+            sock = self.make_socket()
+            sock.connect(self.server_addr)
+            self.selector.register(sock, selectors.EVENT_READ)
+            self.upstreams[client_addr] = sock
+            self.clients[sock] = client_addr
+        return sock
+
+    def enqueue(self, link, sock, data, addr, now) -> None:
+        for arrival in link.schedule(now, len(data)):
+            heapq.heappush(self.events, (arrival, self.order, link, sock, data, addr))
+            self.order += 1
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            now = time.time()
+            while self.events and self.events[0][0] <= now:
+                _, _, link, sock, data, addr = heapq.heappop(self.events)
+                try:
+                    if addr is None:
+                        sock.send(data)
+                    else:
+                        sock.sendto(data, addr)
+                except OSError:
+                    link.dropped += 1  # Full socket buffer or the peer is gone: just another loss
+            timeout = min(self.events[0][0] - now, 0.05) if self.events else 0.05
+            for key, _ in self.selector.select(max(timeout, 0)):
+                sock = key.fileobj
+                while True:
+                    try:
+                        if sock is self.front:
+                            data, client_addr = self.receive(sock, self.uplink)
+                            self.enqueue(self.uplink, self.upstream(client_addr), data, None, time.time())
+                        else:
+                            data, _ = self.receive(sock, self.downlink)
+                            self.enqueue(self.downlink, self.front, data, self.clients[sock], time.time())
+                    except (BlockingIOError, ConnectionRefusedError):
+                        break
+
+class BenchmarkRunner:
+    SERVER_START_TIMEOUT: float = 10.0  # seconds
+    RUN_TIMEOUT: float = 600.0  # seconds per transfer
+    # Lines of the client's summary the report is built from
+    CLIENT_PATTERNS = {
+        "packets_sent": re.compile(r"Total packets sent: (\d+)"),
+        "retransmissions": re.compile(r"Retransmissions: (\d+)"),
+        "fast_retransmissions": re.compile(r"Retransmissions: \d+ \((\d+) fast\)"),
+    }
+
+    def __init__(self, workdir, client_args=(), server_args=(), timeout=None) -> None:
+        self.workdir: str = workdir
+        self.client_args: list = list(client_args)
+        self.server_args: list = list(server_args)
+        self.timeout: float = timeout or self.RUN_TIMEOUT
+        self.commit: str | None = self.git_commit()
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, capture_output=True,
+                                  text=True, timeout=5).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    @staticmethod
+    def free_port() -> int:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    @staticmethod
+    def wait_process(process, timeout):
+        # Wait for a child and return (exit code, resource usage) of that child alone
+        deadline = time.time() + timeout
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                process.returncode = os.waitstatus_to_exitcode(status)
+                return process.returncode, usage
+            if time.time() > deadline:
+                process.kill()
+                _, status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                return None, usage
+            time.sleep(0.01)
+
+    def make_file(self, size, seed) -> str:
+        path = os.path.join(self.workdir, f"bench-{size}-{seed}.bin")
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            rng = random.Random(seed)
+            with open(path, "wb") as f:
+                remaining = size
+                while remaining:
+                    block = min(remaining, 1 << 20)
+                    f.write(rng.randbytes(block))
+                    remaining -= block
+        return path
+
+    def run_once(self, profile_name, profile, size, seed) -> dict:
+        source = self.make_file(size, seed)
+        receive_dir = tempfile.mkdtemp(prefix="recv-", dir=self.workdir)
+        server_port = self.free_port()
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+
+        server_log = open(os.path.join(receive_dir, "server.log"), "w+")
+        server = subprocess.Popen([sys.executable, SERVER, "127.0.0.1", str(server_port), *self.server_args],
+                                  cwd=receive_dir, stdout=server_log, stderr=subprocess.STDOUT, env=env)
+        deadline = time.time() + self.SERVER_START_TIMEOUT
+        while "listening" not in open(server_log.name).read():
+            if time.time() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError(f"Server did not start, see {server_log.name}")
+            time.sleep(0.05)
+
+        proxy = LossyProxy(("127.0.0.1", server_port), profile, seed)
+        proxy.start()
+        start = time.time()
+        client = subprocess.Popen([sys.executable, CLIENT, source, "127.0.0.1", str(proxy.port), *self.client_args],
+                                  cwd=self.workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        # Drain the client's output on a thread so a chatty client never blocks on a full pipe
+        output = []
+        reader = threading.Thread(target=lambda: output.extend(client.stdout), daemon=True)
+        reader.start()
+        client_code, client_usage = self.wait_process(client, self.timeout)
+        elapsed = time.time() - start
+        reader.join()
+        proxy.stop()
+
+        server.send_signal(2)  # SIGINT: the server shuts down cleanly on KeyboardInterrupt
+        _, server_usage = self.wait_process(server, self.SERVER_START_TIMEOUT)
+        server_log.close()
+
+        client_output = b"".join(output).decode(errors="replace")
+        received = os.path.join(receive_dir, os.path.basename(source))
+        identical = os.path.exists(received) and filecmp.cmp(source, received, shallow=False)
+        stats = {name: int(match.group(1)) if (match := pattern.search(client_output)) else None
+                 for name, pattern in self.CLIENT_PATTERNS.items()}
+        client_cpu = client_usage.ru_utime + client_usage.ru_stime
+        server_cpu = server_usage.ru_utime + server_usage.ru_stime
+        if identical:
+            os.remove(received)
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": self.commit,
+            "profile": profile_name,
+            "impairments": profile,
+            "size": size,
+            "seed": seed,
+            "client_args": self.client_args,
+            "success": client_code == 0 and identical,
+            "timed_out": client_code is None,
+            "completion_time": elapsed,
+            "goodput": size / elapsed if identical and elapsed > 0 else 0.0,  # bytes per second
+            "packets_sent": stats["packets_sent"],
+            "retransmissions": stats["retransmissions"],
+            "fast_retransmissions": stats["fast_retransmissions"],
+            "retransmission_ratio": (stats["retransmissions"] / stats["packets_sent"]
+                                     if stats["packets_sent"] and stats["retransmissions"] is not None else None),
+            "client_cpu": client_cpu,
+            "server_cpu": server_cpu,
+            "cpu_ns_per_byte": (client_cpu + server_cpu) * 1e9 / size if size else None,
+            "client_max_rss_kib": client_usage.ru_maxrss,  # KiB on Linux
+            "server_max_rss_kib": server_usage.ru_maxrss,
+            "proxy_dropped": proxy.uplink.dropped + proxy.downlink.dropped,
+            "proxy_duplicated": proxy.uplink.duplicated + proxy.downlink.duplicated,
+            "python": platform.python_version(),
+        }
+
+def parse_size(text) -> int:
+    units = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().removesuffix("B").removesuffix("I")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def parse_profile(text):
+    # A profile name, or name:key=value,... to define one (values accept ms/us and bit/s suffixes)
+    name, _, spec = text.partition(":")
+    if not spec:
+        if name not in PROFILES:
+            raise argparse.ArgumentTypeError(f"Unknown profile {name!r} (known: {', '.join(PROFILES)})")
+        return name, PROFILES[name]
+    profile = {}
+    for item in spec.split(","):
+        key, _, value = item.partition("=")
+        value = value.strip().lower()
+        if value.endswith("ms"):
+            number = float(value[:-2]) / 1000
+        elif value.endswith("us"):
+            number = float(value[:-2]) / 1e6
+        elif value.endswith("mbit"):
+            number = float(value[:-4]) * 1e6 / 8
+        elif value.endswith("kbit"):
+            number = float(value[:-4]) * 1e3 / 8
+        elif value.endswith("%"):
+            number = float(value[:-1]) / 100
+        else:
+            number = float(value)
+        profile[key.strip()] = number
+    try:
+        ImpairedLink(profile, random.Random(0))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return name, profile
+
+def summarize(results) -> dict:
+    # Medians per (profile, size), the numbers worth tracking over time
+    groups = {}
+    for result in results:
+        groups.setdefault((result["profile"], result["size"]), []).append(result)
+    summary = {}
+    for key, runs in groups.items():
+        ok = [run for run in runs if run["success"]]
+        ratios = [run["retransmission_ratio"] for run in ok if run["retransmission_ratio"] is not None]
+        summary[key] = {
+            "runs": len(runs),
+            "failures": len(runs) - len(ok),
+            "goodput": statistics.median(run["goodput"] for run in ok) if ok else 0.0,
+            "completion_time": statistics.median(run["completion_time"] for run in ok) if ok else None,
+            "retransmission_ratio": statistics.median(ratios) if ratios else None,
+            "cpu_ns_per_byte": statistics.median(run["cpu_ns_per_byte"] for run in ok) if ok else None,
+            "max_rss_kib": max(max(run["client_max_rss_kib"], run["server_max_rss_kib"]) for run in runs),
+        }
+    return summary
+
+def print_summary(summary, baseline=None) -> list:
+    # Returns the (profile, size) groups whose goodput regressed against the baseline
+    regressions = []
+    print(f"\n{'profile':<10} {'size':>10} {'runs':>5} {'goodput KiB/s':>14} {'time s':>8} "
+          f"{'retrans %':>9} {'CPU ns/B':>9} {'RSS MiB':>8}" + (f" {'vs base':>8}" if baseline else ""))
+    for (profile, size), row in sorted(summary.items(), key=lambda item: (item[0][0], item[0][1])):
+        retrans = f"{row['retransmission_ratio'] * 100:.1f}" if row["retransmission_ratio"] is not None else "-"
+        cpu = f"{row['cpu_ns_per_byte']:.1f}" if row["cpu_ns_per_byte"] is not None else "-"
+        elapsed = f"{row['completion_time']:.2f}" if row["completion_time"] is not None else "-"
+        line = (f"{profile:<10} {size:>10} {row['runs']:>5} {row['goodput'] / 1024:>14.1f} {elapsed:>8} "
+                f"{retrans:>9} {cpu:>9} {row['max_rss_kib'] / 1024:>8.1f}")
+        if baseline:
+            base = baseline.get((profile, size))
+            if base and base["goodput"]:
+                change = row["goodput"] / base["goodput"] - 1
+                line += f" {change * 100:>+7.1f}%"
+                regressions.append(((profile, size), change))
+            else:
+                line += f" {'-':>8}"
+        if row["failures"]:
+            line += f"  ❌ {row['failures']} failed"
+        print(line)
+    return regressions
+
+def load_results(path) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark urft_client/urft_server on localhost through an impaired UDP proxy")
+    parser.add_argument("--sizes", default="64K,1M,16M", help="Comma-separated file sizes (default: %(default)s)")
+    parser.add_argument("--profiles", default="clean,lossy,wan",
+                        help=f"Comma-separated profiles: {', '.join(PROFILES)}. Custom profiles are written "
+                             f"name:key=value,... with keys {', '.join(ImpairedLink.FIELDS)}, and several "
+                             f"are then separated by ';' (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per profile and size (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for file contents and impairments (default: %(default)s)")
+    parser.add_argument("--output", default="bench_results.jsonl",
+                        help="Append one JSON object per run to this file (default: %(default)s)")
+    parser.add_argument("--baseline", help="Earlier results file to compare median goodput against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Goodput loss against the baseline that counts as a regression (default: %(default)s)")
+    parser.add_argument("--client-args", default="", help="Extra arguments for urft_client.py, as one string")
+    parser.add_argument("--server-args", default="", help="Extra arguments for urft_server.py, as one string")
+    parser.add_argument("--timeout", type=float, default=BenchmarkRunner.RUN_TIMEOUT,
+                        help="Seconds before a transfer is abandoned (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(",")]
+    except ValueError:
+        parser.error(f"Invalid --sizes: {args.sizes}")
+    try:
+        profiles = [parse_profile(profile) for profile in args.profiles.split(";" if ":" in args.profiles else ",")]
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    # Read the baseline up front, it may be the same file this run appends to
+    baseline = summarize(load_results(args.baseline)) if args.baseline else None
+    results = []
+    with tempfile.TemporaryDirectory(prefix="urft-bench-") as workdir:
+        runner = BenchmarkRunner(workdir, args.client_args.split(), args.server_args.split(), args.timeout)
+        total = len(profiles) * len(sizes) * args.repeat
+        for profile_name, profile in profiles:
+            for size in sizes:
+                for repeat in range(args.repeat):
+                    # Each repeat gets its own impairment sequence, identical across benchmark invocations
+                    result = runner.run_once(profile_name, profile, size, args.seed + repeat)
+                    results.append(result)
+                    status = "✅" if result["success"] else "❌"
+                    print(f"{status} [{len(results)}/{total}] {profile_name} {size} bytes: "
+                          f"{result['completion_time']:.2f} s, {result['goodput'] / 1024:.1f} KiB/s")
+                    with open(args.output, "a") as f:
+                        f.write(json.dumps(result) + "\n")
+
+    regressions = print_summary(summarize(results), baseline)
+    print(f"\n📝 Results appended to {args.output}")
+
+    failed = [result for result in results if not result["success"]]
+    regressed = [(key, change) for key, change in regressions if change < -args.tolerance]
+    for (profile, size), change in regressed:
+        print(f"📉 Regression: {profile} {size} bytes, goodput {change * 100:+.1f}% against the baseline")
+    if failed or regressed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -3,45 +3,945 @@ import os
 import sys
 import struct
 import time
+import errno
 import hashlib
+import argparse
+import heapq
+import mmap
+import zlib
+import threading
+import multiprocessing
+import bisect
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from urft_protocol import (HEADER, ACK_HEADER, SACK_BLOCK, FEC_HEADER, ENTRY_HEADER, FLAG_BUSY, FLAG_DIGEST_MISMATCH,
+                           FLAG_PROBE, FLAG_ABORT, PARITY_FLAG, COMPRESSED_FLAG, META_FLAG, PROBE_FLAG, CONTROL_FLAG,
+                           CONTROL_EOF, CONTROL_SKIP, SEQ_MASK, FLAG_SHIFT, LEAF_DIGEST_SIZE, SOL_UDP, set_buffer)
+from urft_metrics import MetricsRegistry, EventTracer, MetricsLog, MetricsServer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
 
 DEVMODE = False
 
+class CongestionController:
+    MODES = ("fixed", "reno", "cubic")
+    INITIAL_WINDOW: int = 10  # packets
+    MIN_WINDOW: int = 2  # packets
+    MAX_WINDOW: int = 4096  # packets
+    RENO_BETA: float = 0.5  # Multiplicative decrease factor for AIMD
+    CUBIC_BETA: float = 0.7  # Multiplicative decrease factor for CUBIC (RFC 9438)
+    CUBIC_C: float = 0.4  # CUBIC scaling constant
+
+    def __init__(self, mode='cubic', fixed_window=10) -> None:
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown congestion control mode: {mode} (choose from {', '.join(self.MODES)})")
+        self.mode: str = mode
+        self.cwnd: float = fixed_window if mode == "fixed" else self.INITIAL_WINDOW
+        self.ssthresh: float = float('inf')
+        self.recovery_seq: int = 0  # Losses below this sequence belong to an already handled event
+        self.loss_events = 0
+        self.receive_window: int = self.MAX_WINDOW  # Packets the receiver's socket buffer can hold
+        # CUBIC state
+        self.w_max: float = 0.0
+        self.w_est: float = 0.0  # Reno-friendly window estimate
+        self.k: float = 0.0
+        self.epoch_start: float | None = None
+
+    @property
+    def window_size(self) -> int:
+        return max(self.MIN_WINDOW, min(self.MAX_WINDOW, self.receive_window, int(self.cwnd)))
+
+    @property
+    def in_slow_start(self) -> bool:
+        return self.cwnd < self.ssthresh
+
+    def on_ack(self, acked=1) -> None:
+        if self.mode == "fixed":
+            return
+        for _ in range(acked):
+            if self.in_slow_start:
+                self.cwnd += 1  # Exponential growth: one packet per ACK doubles cwnd every RTT
+            elif self.mode == "reno":
+                self.cwnd += 1 / self.cwnd  # Additive increase: one packet per RTT
+            else:
+                self._cubic_update()
+        # Growth past what the receiver accepts is never tested by the network (RFC 7661),
+        # and would only have to be shed by later losses before the window really shrinks
+        self.cwnd = min(self.cwnd, self.MAX_WINDOW, self.receive_window)
+
+    def _cubic_update(self) -> None:
+        now = time.time()
+        if self.epoch_start is None:
+            # First ACK of a new congestion avoidance epoch
+            self.epoch_start = now
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / self.CUBIC_C) ** (1 / 3)
+            else:
+                self.k = 0.0
+                self.w_max = self.cwnd
+            self.w_est = self.cwnd
+
+        t = now - self.epoch_start
+        target = self.CUBIC_C * (t - self.k) ** 3 + self.w_max
+        if target > self.cwnd:
+            self.cwnd += (target - self.cwnd) / self.cwnd
+        else:
+            self.cwnd += 0.01 / self.cwnd  # Plateau around w_max, probe very slowly
+
+        # Never grow slower than standard AIMD would on the same path
+        self.w_est += 3 * (1 - self.CUBIC_BETA) / (1 + self.CUBIC_BETA) / self.cwnd
+        self.cwnd = max(self.cwnd, self.w_est)
+
+    def on_loss(self, seq_num, next_seq_num) -> bool:
+        # Returns True if this loss started a new congestion event and the window was reduced
+        if self.mode == "fixed" or seq_num < self.recovery_seq:
+            return False  # Only one reduction per window of data
+
+        self.recovery_seq = next_seq_num
+        self.loss_events += 1
+        if self.mode == "reno":
+            self.cwnd = max(self.cwnd * self.RENO_BETA, self.MIN_WINDOW)
+        else:
+            # Fast convergence: release bandwidth faster if the last peak was not reached
+            if self.cwnd < self.w_max:
+                self.w_max = self.cwnd * (1 + self.CUBIC_BETA) / 2
+            else:
+                self.w_max = self.cwnd
+            self.cwnd = max(self.cwnd * self.CUBIC_BETA, self.MIN_WINDOW)
+            self.epoch_start = None
+        self.ssthresh = self.cwnd
+        return True
+
+class RttEstimator:
+    ALPHA: float = 1 / 8  # Gain for the smoothed RTT (RFC 6298)
+    BETA: float = 1 / 4  # Gain for the RTT variation (RFC 6298)
+    K: int = 4  # RTTVAR multiplier
+    MIN_RTO: float = 0.05  # seconds
+    MAX_RTO: float = 60.0  # seconds
+
+    def __init__(self, initial_rto=1.0) -> None:
+        self.srtt: float | None = None
+        self.rttvar: float = 0.0
+        self.rto: float = initial_rto
+        self.backoff_until: float = 0.0  # Timeouts before this belong to the same backoff step
+        self.samples = 0
+
+    def on_sample(self, rtt) -> None:
+        # Callers must apply Karn's rule: never sample a packet that was retransmitted
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.rto = min(max(self.srtt + self.K * self.rttvar, self.MIN_RTO), self.MAX_RTO)
+        self.samples += 1
+
+    def backoff(self, now) -> None:
+        # Exponential backoff, applied once per RTO even if many packets expire together
+        if now >= self.backoff_until:
+            self.rto = min(self.rto * 2, self.MAX_RTO)
+            self.backoff_until = now + self.rto
+
+class Pacer:
+    # Token bucket that spreads each window over the round trip instead of firing it back to
+    # back. The rate follows the congestion window, gain * cwnd * packet size / smoothed RTT,
+    # with a higher gain in slow start so pacing never holds the window's growth back.
+    SLOW_START_GAIN: float = 2.0
+    CONGESTION_AVOIDANCE_GAIN: float = 1.25
+    QUANTUM: float = 0.002  # seconds of sending allowed in one burst (and one GSO send)
+    MIN_BURST_PACKETS: int = 4
+
+    def __init__(self, packet_size) -> None:
+        self.packet_size: int = packet_size
+        self.rate: float | None = None  # bytes per second, None until the first RTT sample
+        self.tokens: float = 0.0
+        self.burst: float = 0.0
+        self.last_refill: float = time.time()
+
+    def update(self, window, srtt, slow_start) -> None:
+        if not srtt:
+            return
+        gain = self.SLOW_START_GAIN if slow_start else self.CONGESTION_AVOIDANCE_GAIN
+        self.rate = gain * window * self.packet_size / srtt
+        self.burst = max(self.MIN_BURST_PACKETS * self.packet_size, self.rate * self.QUANTUM)
+
+    def refill(self, now) -> None:
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def ready(self) -> bool:
+        # Unpaced until the first RTT sample; afterwards a packet may overdraw the bucket once
+        return self.rate is None or self.tokens > 0
+
+    def consume(self, nbytes) -> None:
+        if self.rate is not None:
+            self.tokens -= nbytes
+
+    def delay(self, now) -> float:
+        # Seconds until the bucket allows the next packet
+        if self.ready():
+            return 0.0
+        return max(0.0, -self.tokens / self.rate - (now - self.last_refill))
+
+class ParityEncoder:
+    # XOR forward error correction: after every block of K data packets one parity packet
+    # carries the XOR of their payloads (zero-padded to the chunk size) and of their lengths,
+    # so the receiver can rebuild any single lost packet of the block without a round trip.
+    # In "auto" mode K follows the observed loss rate and parity stops on clean paths.
+    MIN_BLOCK: int = 2
+    MAX_BLOCK: int = 64
+    AUTO_MIN_LOSS: float = 0.005  # Below this loss rate "auto" sends no parity at all
+
+    def __init__(self, block_size, chunk_size) -> None:
+        self.auto: bool = block_size == "auto"
+        self.block_size: int = 0 if self.auto else int(block_size)
+        self.chunk_size: int = chunk_size
+        self.block_start: int | None = None  # First sequence number of the open block
+        self.block_target: int = 0
+        self.count: int = 0
+        self.xor: int = 0
+        self.length_xor: int = 0
+        self.parity_sent = 0
+
+    def adapt(self, loss_rate) -> None:
+        if not self.auto:
+            return
+        if loss_rate < self.AUTO_MIN_LOSS:
+            self.block_size = 0
+        else:
+            # Aim for well under one loss per block, a single XOR parity can only repair one
+            self.block_size = max(self.MIN_BLOCK, min(self.MAX_BLOCK, int(1 / (2 * loss_rate))))
+
+    def add(self, seq_num, payload):
+        # Feed a first transmission; returns (sequence field, payload) of a parity packet when a block closes
+        if self.block_start is None:
+            if self.block_size < self.MIN_BLOCK:
+                return None
+            self.block_start = seq_num
+            self.block_target = self.block_size
+        self.xor ^= int.from_bytes(payload, 'big') << (8 * (self.chunk_size - len(payload)))
+        self.length_xor ^= len(payload)
+        self.count += 1
+        if self.count >= self.block_target:
+            return self.flush()
+        return None
+
+    def flush(self):
+        # Close the open block early (end of file); returns its parity packet, if any
+        if self.block_start is None:
+            return None
+        parity = (PARITY_FLAG | self.block_start,
+                  FEC_HEADER.pack(self.count, self.length_xor) + self.xor.to_bytes(self.chunk_size, 'big'))
+        self.block_start = None
+        self.count = self.xor = self.length_xor = 0
+        self.parity_sent += 1
+        return parity
+
+class ChunkCompressor:
+    # Compresses every chunk on its own, so any packet can be decompressed in whatever order it
+    # arrives. Batches of chunks are compressed ahead of the sender on a thread pool (the codecs
+    # release the GIL), and after a run of chunks that do not compress only one chunk every
+    # PROBE_INTERVAL is tried.
+    MIN_SAVING: float = 0.1  # Send compressed only if it saves at least this fraction
+    MISS_LIMIT: int = 8  # Incompressible chunks in a row before backing off
+    PROBE_INTERVAL: int = 64  # Chunks sent raw between probes while backed off
+    BATCH_SIZE: int = 32  # Chunks per pool task, one chunk is too little work to hand to a thread
+    MAX_LOOKAHEAD: int = 512  # Chunks compressed ahead of the sender
+
+    def __init__(self, codec, threads=None) -> None:
+        self.codec: str = codec
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers=threads or min(4, os.cpu_count() or 1),
+                                       thread_name_prefix="urft-compress")
+        self.pending = {}  # first chunk index of a batch -> future of its [(tried, data)] list
+        self.ready = {}  # chunk index -> (tried, data) taken out of finished batches
+        self.next_index = 0  # Next chunk index to schedule, always a multiple of BATCH_SIZE
+        self.misses = 0
+        self.skip = 0
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+
+    @staticmethod
+    def available() -> list:
+        # Preference order, best first
+        codecs = []
+        if zstandard is not None:
+            codecs.append("zstd")
+        if lz4 is not None:
+            codecs.append("lz4")
+        codecs.append("zlib")
+        return codecs
+
+    def compress(self, chunk):
+        if self.codec == "zstd":
+            if not hasattr(self.local, "zstd"):
+                self.local.zstd = zstandard.ZstdCompressor(level=3)  # Compressors are not thread-safe
+            data = self.local.zstd.compress(chunk)
+        elif self.codec == "lz4":
+            data = lz4.block.compress(chunk, store_size=False)  # The receiver knows the chunk size
+        else:
+            data = zlib.compress(chunk, 1)
+        return data if len(data) <= len(chunk) * (1 - self.MIN_SAVING) else None
+
+    def compress_batch(self, chunks, start, tries):
+        return [(tried, self.compress(chunks[start + i]) if tried else None) for i, tried in enumerate(tries)]
+
+    def schedule(self, chunks, upto) -> None:
+        upto = min(upto, len(chunks), self.next_index + self.MAX_LOOKAHEAD)
+        while self.next_index < upto:
+            start = self.next_index
+            tries = []
+            for _ in range(min(self.BATCH_SIZE, len(chunks) - start)):
+                tries.append(self.skip == 0)
+                self.skip = max(self.skip - 1, 0)
+            self.pending[start] = self.pool.submit(self.compress_batch, chunks, start, tries)
+            self.next_index += len(tries)
+
+    def take(self, chunks, index):
+        # Returns (payload, compressed) for the chunk at `index`, waiting for its batch if needed
+        if index not in self.ready:
+            self.schedule(chunks, index + 1)
+            # Batches are aligned to BATCH_SIZE, except after a short one cut at the end of a stream's data so far
+            start = max(batch_start for batch_start in self.pending if batch_start <= index)
+            for i, result in enumerate(self.pending.pop(start).result()):
+                self.ready[start + i] = result
+        tried, data = self.ready.pop(index)
+        chunk = chunks[index]
+        if tried and data is None:
+            self.misses += 1
+            if self.misses >= self.MISS_LIMIT:
+                self.skip = self.PROBE_INTERVAL
+                self.misses = self.MISS_LIMIT - 1  # A failed probe backs off again straight away
+        elif tried:
+            self.misses = 0
+        self.raw_bytes += len(chunk)
+        self.wire_bytes += len(data) if data is not None else len(chunk)
+        return (data, True) if data is not None else (chunk, False)
+
+    def seek(self, index) -> None:
+        # The sender jumped ahead (resumed transfer): forget work for the chunks it skipped
+        start = index - index % self.BATCH_SIZE
+        for batch_start in [b for b in self.pending if b < start]:
+            self.pending.pop(batch_start).cancel()
+        for skipped in [i for i in self.ready if i < index]:
+            del self.ready[skipped]
+        self.next_index = max(self.next_index, start)
+
+    def close(self) -> None:
+        for future in self.pending.values():
+            future.cancel()
+        self.pool.shutdown(wait=True)
+        self.pending.clear()
+        self.ready.clear()
+
+class FileChunks:
+    # Lazy, random-access view of a file as fixed-size payloads. Memory-mapped files hand out
+    # zero-copy memoryview slices of the page cache; otherwise each chunk is read on demand,
+    # so only the payloads still in the window are ever held in memory. A byte range of the
+    # file can be served on its own, for striped transfers.
+
+    def __init__(self, file, chunk_size, use_mmap=True, start=0, end=None) -> None:
+        self.file = file
+        self.chunk_size: int = chunk_size
+        file_size = os.fstat(file.fileno()).st_size
+        self.start: int = min(start, file_size)
+        self.end: int = file_size if end is None else min(end, file_size)
+        self.size: int = self.end - self.start
+        self.mmap: mmap.mmap | None = None
+        self.view: memoryview | None = None
+        if use_mmap and file_size > 0 and self.size > 0:
+            try:
+                self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self.mmap)
+            except (OSError, ValueError):
+                self.mmap = None  # Not mappable (special file, exotic filesystem), stream instead
+
+    def __len__(self) -> int:
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    def __getitem__(self, index):
+        offset = self.start + index * self.chunk_size
+        size = min(self.chunk_size, self.end - offset)
+        if self.view is not None:
+            return self.view[offset:offset + size]
+        if hasattr(os, "pread"):
+            return os.pread(self.file.fileno(), size, offset)
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def close(self) -> None:
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass  # Payload slices are still referenced, the mapping goes away with them
+            self.mmap = None
+
+class StreamChunks:
+    # Chunks of a source of unknown length: bytes, an iterator of bytes, or a binary file object
+    # or pipe. A reader thread re-cuts whatever the source yields into chunk-size payloads and
+    # stays at most MAX_BUFFERED chunks ahead of the sender, so a fast producer is never buffered
+    # whole and a slow one never blocks the ACK and retransmission loop.
+    MAX_BUFFERED: int = 1024  # Chunks read ahead of the sender
+    READ_SIZE: int = 256 * 1024  # bytes asked of file-like sources per read
+    WAIT_SLICE: float = 0.05  # seconds, bounds the reader's sleep if a wakeup is missed
+
+    def __init__(self, source, chunk_size) -> None:
+        self.chunk_size: int = chunk_size
+        self.chunks = {}  # index -> payload, from `released` up to `count`
+        self.count = 0  # Chunks read so far; only the reader thread writes it
+        self.size = 0  # Bytes read so far
+        self.released = 0  # Chunks below this index have been sent and dropped here
+        self.done = False  # Set once the source is exhausted and every chunk is counted
+        self.closed = False
+        self.error: Exception | None = None
+        self.reader_waiting = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.read, args=(source,), name="urft-stream-reader", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def pieces(source, read_size):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            yield bytes(source)
+        elif hasattr(source, "read"):
+            while piece := source.read(read_size):
+                yield piece
+        else:
+            yield from source
+
+    def read(self, source) -> None:
+        pending = b""
+        try:
+            for piece in self.pieces(source, self.READ_SIZE):
+                if not isinstance(piece, (bytes, bytearray, memoryview)):
+                    raise TypeError(f"Stream sources must yield bytes, not {type(piece).__name__}")
+                data = pending + piece if pending else piece
+                offset = 0
+                while len(data) - offset >= self.chunk_size:
+                    self.append(bytes(data[offset:offset + self.chunk_size]))
+                    offset += self.chunk_size
+                pending = bytes(data[offset:])
+                if self.closed:
+                    return
+            if pending:
+                self.append(pending)
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def append(self, chunk) -> None:
+        with self.condition:
+            while self.count - self.released >= self.MAX_BUFFERED and not self.closed:
+                self.reader_waiting = True
+                self.condition.wait(self.WAIT_SLICE)
+            self.reader_waiting = False
+            self.chunks[self.count] = chunk
+            self.size += len(chunk)
+            self.count += 1  # Last, the sender takes count as the number of chunks it may read
+            self.condition.notify_all()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index):
+        return self.chunks[index]
+
+    def exhausted(self, index) -> bool:
+        # True once the source has ended and every chunk before `index` is all there is
+        done = self.done  # Read before count: count is final once done is set
+        if self.error is not None:
+            raise self.error
+        return done and index >= self.count
+
+    def release(self, index) -> None:
+        # Chunks below `index` are sent, the window keeps its own reference until they are acknowledged
+        for released in range(self.released, index):
+            self.chunks.pop(released, None)
+        self.released = max(self.released, index)
+        if self.reader_waiting:
+            with self.condition:
+                self.condition.notify_all()
+
+    def wait(self, index, timeout) -> None:
+        # Block until chunk `index` is readable or the source ends
+        with self.condition:
+            self.condition.wait_for(lambda: self.count > index or self.done, timeout)
+
+    def close(self) -> None:
+        # A reader blocked inside the source's own read stays blocked; the thread is a daemon
+        self.closed = True
+        with self.condition:
+            self.condition.notify_all()
+        self.chunks.clear()
+
+class TreeChunks:
+    # Several files laid out back to back as one sequence of payloads. Every file contributes a
+    # metadata payload (size and relative path) followed by its chunks, so one session carries a
+    # whole directory tree, the window stays full across file boundaries and the receiver learns
+    # about each file just before its data.
+    MAX_OPEN_FILES: int = 64  # Descriptors kept open, least recently used ones are closed
+
+    def __init__(self, paths, chunk_size) -> None:
+        self.chunk_size: int = chunk_size
+        self.entries = []  # (path, relative path, size)
+        for path in paths:
+            # Relative paths keep the name of the directory or file given on the command line
+            base = os.path.dirname(os.path.abspath(path))
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        full_path = os.path.join(root, name)
+                        relative = os.path.relpath(os.path.abspath(full_path), base).replace(os.sep, "/")
+                        self.entries.append((full_path, relative, os.path.getsize(full_path)))
+            else:
+                self.entries.append((path, os.path.basename(path), os.path.getsize(path)))
+        # The server writes each entry to its relative path, a second one would overwrite the first
+        seen = {}
+        for path, relative, _ in self.entries:
+            if relative in seen:
+                raise ValueError(f"{path} and {seen[relative]} would both be received as {relative}")
+            seen[relative] = path
+        self.size: int = sum(size for _, _, size in self.entries)
+        self.layout(chunk_size)
+        self.open_files = OrderedDict()  # entry -> descriptor, least recently used first
+        self.lock = threading.Lock()  # The compression pool reads chunks from its own threads
+
+    def layout(self, chunk_size) -> None:
+        # Place every file in the sequence space, once the chunk size is known
+        self.chunk_size = chunk_size
+        self.starts = []  # Index of each file's metadata payload
+        index = 0
+        for _, _, size in self.entries:
+            self.starts.append(index)
+            index += 1 + (size + chunk_size - 1) // chunk_size
+        self.length: int = index
+
+    def __len__(self) -> int:
+        return self.length
+
+    def is_meta(self, index) -> bool:
+        entry = bisect.bisect_right(self.starts, index) - 1
+        return self.starts[entry] == index
+
+    def __getitem__(self, index):
+        entry = bisect.bisect_right(self.starts, index) - 1
+        path, relative, size = self.entries[entry]
+        local = index - self.starts[entry]
+        if local == 0:
+            return ENTRY_HEADER.pack(size) + relative.encode('utf-8')
+        with self.lock:
+            fd = self.open_files.pop(entry, None)
+            if fd is None:
+                if len(self.open_files) >= self.MAX_OPEN_FILES:
+                    os.close(self.open_files.popitem(last=False)[1])
+                fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            self.open_files[entry] = fd
+            offset = (local - 1) * self.chunk_size
+            if hasattr(os, "pread"):
+                return os.pread(fd, self.chunk_size, offset)
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, self.chunk_size)
+
+    def close(self) -> None:
+        with self.lock:
+            for fd in self.open_files.values():
+                os.close(fd)
+            self.open_files.clear()
+
 class TCPficationClient:
     BUFFER_SIZE: int = 1450
-    TIMEOUT: float = 1  # seconds
-    WINDOW_SIZE: int = 10   # Number of packets that can be in flight
+    TIMEOUT: float = 1  # seconds, initial retransmission timeout before the first RTT sample
+    WINDOW_SIZE: int = 10   # Number of packets in flight for the "fixed" congestion control mode
     STATUS_INTERVAL: float = 2.0  # seconds between status updates
     MAX_RETRIES: int = 20  # Maximum retries per packet
+    IDLE_TIMEOUT: float = 30.0  # seconds without ACK progress before the whole transfer is abandoned
+    DUP_ACK_THRESHOLD: int = 3  # ACKs reporting a hole before the missing packet is fast-retransmitted
+    USE_MMAP: bool = True  # Memory-map the file being sent instead of reading chunks on demand
+    USE_GSO: bool = True  # Send window bursts as UDP_SEGMENT super-datagrams where the kernel supports it
+    GSO_MAX_SEGMENTS: int = 64  # Kernel limit on segments per GSO send
+    GSO_MAX_BYTES: int = 65000  # A GSO send must still fit in one UDP datagram
+    UDP_SEGMENT: int = getattr(socket, "UDP_SEGMENT", 103)  # Linux >= 4.18
+    GSO_UNSUPPORTED = (errno.EINVAL, errno.EIO, errno.EOPNOTSUPP)  # sendmsg errors of a kernel or device that cannot segment
+    ACK_BUFFER_SIZE: int = 1024  # bytes, large enough for an ACK frame with all its SACK blocks
+    SOCKET_BUFFER: int = 4 * 1024 * 1024  # bytes requested for SO_SNDBUF / SO_RCVBUF, the kernel may cap it
+    PACKET_OVERHEAD: int = 20 + 8 + 8 + 4  # IPv4, UDP, our header and the FEC header of parity packets
+    JUMBO_MTUS = (9000,)  # Larger path MTUs worth probing for, largest first
+    PROBE_ATTEMPTS: int = 2
+    PROBE_TIMEOUT: float = 0.2  # seconds to wait for a probe's echo
+    IP_MTU_DISCOVER: int = getattr(socket, "IP_MTU_DISCOVER", 10)
+    IP_PMTUDISC_DO: int = getattr(socket, "IP_PMTUDISC_DO", 2)
+    IP_MTU: int = getattr(socket, "IP_MTU", 14)
+    METRICS = (
+        ("packets_sent_total", "counter", "Datagrams sent, including retransmissions, parity and EOF"),
+        ("bytes_sent_total", "counter", "Payload bytes sent, including retransmissions and parity"),
+        ("retransmissions_total", "counter", "Packets sent again after a timeout or a fast retransmit"),
+        ("fast_retransmissions_total", "counter", "Packets retransmitted because ACKs reported them missing"),
+        ("parity_packets_sent_total", "counter", "FEC parity packets sent"),
+        ("skipped_packets_total", "counter", "Packets given up after the maximum retries and skipped"),
+        ("send_drops_total", "counter", "Packets lost to a full send queue (EAGAIN, ENOBUFS), left to retransmission"),
+        ("loss_events_total", "counter", "Congestion events that reduced the window"),
+        ("resumed_bytes_total", "counter", "Bytes the server already held from an interrupted attempt"),
+        ("compression_raw_bytes_total", "counter", "Chunk bytes before compression"),
+        ("compression_wire_bytes_total", "counter", "Chunk bytes after compression"),
+        ("congestion_window_packets", "gauge", "Packets the congestion controller allows in flight"),
+        ("receive_window_packets", "gauge", "Packets the server's receive buffer share allows in flight"),
+        ("packets_in_flight", "gauge", "Packets sent and not yet acknowledged"),
+        ("smoothed_rtt_seconds", "gauge", "Smoothed round-trip time"),
+        ("rto_seconds", "gauge", "Retransmission timeout"),
+        ("pacing_rate_bytes", "gauge", "Pacing rate in bytes per second"),
+        ("chunk_size_bytes", "gauge", "Payload bytes per packet"),
+    )
 
-    def __init__(self, host='10.20.23.32', port=6969) -> None:
+    def __init__(self, host='10.20.23.32', port=6969, cc_mode='cubic', fec=None, compress=None, resume=False,
+                 mtu="auto", pacing=True, sndbuf=None, rcvbuf=None, trace=None, metrics_log=None,
+                 metrics_port=None) -> None:
         self.host: str = host
         self.port: int = port
+        self.fec = fec  # Parity block size K, "auto", or None to disable forward error correction
+        self.compress = compress  # Codec to offer, "auto" for every available one, or None
+        self.resume: bool = resume  # Identify the file by its digest so the server can resume a partial copy
+        self.resumed_bytes = 0
+        self.cc: CongestionController = CongestionController(cc_mode, self.WINDOW_SIZE)
+        self.rtt: RttEstimator = RttEstimator(self.TIMEOUT)
         self.client_socket: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.client_socket.settimeout(self.TIMEOUT)
+        self.sndbuf: int = set_buffer(self.client_socket, socket.SO_SNDBUF, sndbuf or self.SOCKET_BUFFER)
+        self.rcvbuf: int = set_buffer(self.client_socket, socket.SO_RCVBUF, rcvbuf or self.SOCKET_BUFFER)
+        self.mtu = mtu  # Path MTU in bytes, or "auto" to probe for jumbo frames
+        self.chunk_size: int = self.BUFFER_SIZE  # Payload bytes per packet, settled in the handshake
+        self.pacing: bool = pacing
         self.retransmissions = 0
+        self.fast_retransmissions = 0
         self.packets_sent = 0
         self.lost_packets = set()  # Track packets that couldn't be delivered
+        # Scatter-gather send avoids concatenating header and payload (not available on Windows)
+        self.use_sendmsg: bool = hasattr(self.client_socket, "sendmsg")
+        self.use_gso: bool = self.USE_GSO and self.use_sendmsg and sys.platform.startswith("linux")
+        self.gso_sends = 0  # Super-datagrams handed to the kernel
+        self.gso_progress = 0  # Packets of the current burst already sent, for the fallback path
+        self.send_drops = 0  # Packets the kernel had no room for, recovered like network losses
+        self.bytes_sent = 0
+        # State of the transfer in progress that metrics read: unacknowledged packets, FEC, compression, pacing
+        self.in_flight = {}
+        self.parity = self.compressor = self.pacer = None
+
+        # Observability: metrics are read on demand, trace events go through a background writer
+        self.metrics: MetricsRegistry = MetricsRegistry("urft_client")
+        self.metrics.describe(self.METRICS)
+        self.metrics.add_source(self.collect_metrics)
+        self.tracer: EventTracer | None = EventTracer(trace, "client") if trace else None
+        self.metrics_log: MetricsLog | None = MetricsLog(self.metrics, metrics_log) if metrics_log else None
+        self.metrics_server: MetricsServer | None = MetricsServer(self.metrics, "127.0.0.1", metrics_port) if metrics_port else None
+
+    def collect_metrics(self) -> list:
+        # May run on the metrics server's thread, so it only reads
+        compressor = self.compressor
+        return [
+            ("packets_sent_total", {}, self.packets_sent),
+            ("bytes_sent_total", {}, self.bytes_sent),
+            ("retransmissions_total", {}, self.retransmissions),
+            ("fast_retransmissions_total", {}, self.fast_retransmissions),
+            ("parity_packets_sent_total", {}, self.parity.parity_sent if self.parity is not None else 0),
+            ("skipped_packets_total", {}, len(self.lost_packets)),
+            ("send_drops_total", {}, self.send_drops),
+            ("loss_events_total", {}, self.cc.loss_events),
+            ("resumed_bytes_total", {}, self.resumed_bytes),
+            ("compression_raw_bytes_total", {}, compressor.raw_bytes if compressor is not None else 0),
+            ("compression_wire_bytes_total", {}, compressor.wire_bytes if compressor is not None else 0),
+            ("congestion_window_packets", {}, self.cc.window_size),
+            ("receive_window_packets", {}, self.cc.receive_window),
+            ("packets_in_flight", {}, len(self.in_flight)),
+            ("smoothed_rtt_seconds", {}, self.rtt.srtt or 0.0),
+            ("rto_seconds", {}, self.rtt.rto),
+            ("pacing_rate_bytes", {}, (self.pacer.rate or 0.0) if self.pacer is not None else 0.0),
+            ("chunk_size_bytes", {}, self.chunk_size),
+        ]
+
+    def close(self) -> None:
+        # Stop the metrics and trace writers, flushing what they still hold
+        if self.metrics_log is not None:
+            self.metrics_log.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        if self.tracer is not None:
+            self.tracer.close()
+        self.client_socket.close()
+
+    def path_mtu(self):
+        # MTU of the route to the server as the kernel knows it, None where that cannot be asked
+        probe_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe_socket.setsockopt(socket.IPPROTO_IP, self.IP_MTU_DISCOVER, self.IP_PMTUDISC_DO)
+            probe_socket.connect((self.host, self.port))
+            return probe_socket.getsockopt(socket.IPPROTO_IP, self.IP_MTU)
+        except OSError:
+            return None
+        finally:
+            probe_socket.close()
+
+    def fits_sequence_space(self, chunk_count) -> bool:
+        # Sequence numbers share their field with the packet flags, so a transfer's chunks and
+        # its EOF must be numbered within SEQ_MASK; past that they would read as flagged frames
+        if chunk_count < SEQ_MASK:
+            return True
+        print(f"❌ {chunk_count} chunks of {self.chunk_size} bytes are more than one transfer can number "
+              f"({SEQ_MASK - 1}), use --streams or a larger MTU")
+        return False
+
+    def probe_chunk_size(self) -> int:
+        # Largest payload that crosses the path unfragmented. Ordinary 1500-byte paths keep
+        # BUFFER_SIZE without a round trip; on a jumbo-frame route, DF-marked probes of each
+        # candidate size must be echoed by the server before we use it.
+        if self.mtu != "auto":
+            return int(self.mtu) - self.PACKET_OVERHEAD
+        route_mtu = self.path_mtu()
+        if route_mtu is None or route_mtu <= 1500:
+            return self.BUFFER_SIZE
+        probe_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe_socket.setsockopt(socket.IPPROTO_IP, self.IP_MTU_DISCOVER, self.IP_PMTUDISC_DO)
+            probe_socket.connect((self.host, self.port))
+            probe_socket.settimeout(self.PROBE_TIMEOUT)
+            for probe_id, mtu in enumerate(m for m in self.JUMBO_MTUS if m <= route_mtu):
+                payload = bytes(mtu - 20 - 8 - HEADER.size)
+                for _ in range(self.PROBE_ATTEMPTS):
+                    try:
+                        probe_socket.send(self.header(PROBE_FLAG | probe_id, payload) + payload)
+                        while True:
+                            ack = probe_socket.recv(self.ACK_BUFFER_SIZE)
+                            ack_num, flags, _ = ACK_HEADER.unpack_from(ack)
+                            if flags & FLAG_PROBE and ack_num == probe_id:
+                                print(f"📏 Path MTU {mtu} confirmed, sending {mtu - self.PACKET_OVERHEAD}-byte chunks")
+                                return mtu - self.PACKET_OVERHEAD
+                    except socket.timeout:
+                        continue
+                    except OSError:
+                        break  # EMSGSIZE: the kernel already knows the path is smaller
+        finally:
+            probe_socket.close()
+        return self.BUFFER_SIZE
+
+    def header(self, seq_num, payload) -> bytes:
+        # Seeding the CRC with the sequence number also catches a corrupted header
+        return HEADER.pack(seq_num, zlib.crc32(payload, seq_num))
+
+    @staticmethod
+    def send_dropped(error) -> bool:
+        # A full socket or device queue loses the packet like the network would, retransmission recovers it
+        return isinstance(error, (BlockingIOError, TimeoutError)) or error.errno == errno.ENOBUFS
+
+    def send_packet(self, seq_num, payload) -> None:
+        header = self.header(seq_num, payload)
+        try:
+            if self.use_sendmsg:
+                self.client_socket.sendmsg([header, payload], [], 0, (self.host, self.port))
+            else:
+                self.client_socket.sendto(header + payload, (self.host, self.port))
+        except OSError as e:
+            if not self.send_dropped(e):
+                raise
+            self.send_drops += 1
+
+    @staticmethod
+    def parse_options(payload) -> dict:
+        # NUL-separated key=value pairs, as carried by the handshake and its ACK
+        return dict(option.decode().split("=", 1) for option in bytes(payload).split(b"\0") if b"=" in option)
+
+    def digest_file(self, file_path):
+        # The same leaf tree send_file builds on the fly, computed up front when it has to be known before the handshake
+        digest = hashlib.blake2b(digest_size=32)
+        with open(file_path, 'rb') as file:
+            chunks = FileChunks(file, self.chunk_size, self.USE_MMAP)
+            for index in range(len(chunks)):
+                digest.update(hashlib.blake2b(chunks[index], digest_size=LEAF_DIGEST_SIZE).digest())
+            chunks.close()
+        return digest
+
+    def send_burst(self, packets) -> None:
+        # Send [(seq_num, payload), ...] with as few syscalls as possible
+        sent = 0
+        if self.use_gso and len(packets) > 1:
+            try:
+                sent = self.send_gso(packets)
+            except OSError as e:
+                if e.errno not in self.GSO_UNSUPPORTED:
+                    raise
+                # Not supported by the kernel or the outgoing device: go back to one datagram per packet
+                print(f"⚠️ UDP GSO unavailable ({e}), sending packets one by one")
+                self.use_gso = False
+                sent = self.gso_progress
+        for seq_num, payload in packets[sent:]:
+            self.send_packet(seq_num, payload)
+
+    def send_gso(self, packets) -> int:
+        # Every segment of a GSO send has the same size except possibly a shorter last one,
+        # so runs of full-size packets share one sendmsg with the headers and payloads scattered
+        self.gso_progress = 0
+        index = 0
+        while index < len(packets):
+            segment_size = HEADER.size + len(packets[index][1])
+            max_segments = min(self.GSO_MAX_SEGMENTS, self.GSO_MAX_BYTES // segment_size)
+            end = index + 1
+            while end < len(packets) and end - index < max_segments:
+                length = HEADER.size + len(packets[end][1])
+                if length > segment_size:
+                    break
+                end += 1
+                if length < segment_size:
+                    break  # A short segment has to be the last one
+            if end - index == 1:
+                self.send_packet(*packets[index])
+            else:
+                buffers = []
+                for seq_num, payload in packets[index:end]:
+                    buffers.append(self.header(seq_num, payload))
+                    buffers.append(payload)
+                try:
+                    self.client_socket.sendmsg(buffers, [(SOL_UDP, self.UDP_SEGMENT, struct.pack("=H", segment_size))],
+                                               0, (self.host, self.port))
+                    self.gso_sends += 1
+                except OSError as e:
+                    if not self.send_dropped(e):
+                        raise
+                    self.send_drops += end - index
+            index = end
+            self.gso_progress = index
+        return index
+
+    def send_files(self, paths):
+        # One regular file goes out as before; directories and file lists share a single session
+        if len(paths) == 1 and os.path.isfile(paths[0]):
+            return self.send_file(paths[0])
+        try:
+            tree = TreeChunks(paths, self.BUFFER_SIZE)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return False
+        if not tree.entries:
+            print("❌ Nothing to send")
+            return False
+        return self.send_file(paths[0], tree)
+
+    def send_stream(self, source, name="stream"):
+        # Send bytes, an iterator of bytes, or a binary file object or pipe, read as the window allows
+        return self.send_file(name, stream=source)
+
+    @classmethod
+    def stripe_range(cls, file_size, index, count):
+        # Byte range of stripe `index` out of `count`, cut on chunk boundaries
+        per_stripe = (file_size + cls.BUFFER_SIZE - 1) // cls.BUFFER_SIZE
+        per_stripe = (per_stripe + count - 1) // count * cls.BUFFER_SIZE
+        start = min(index * per_stripe, file_size)
+        return start, min(start + per_stripe, file_size)
 
-    def send_file(self, file_path):
+    def send_file(self, file_path, tree=None, stripe=None, stream=None):
         try:
-            filename = os.path.basename(file_path)
+            filename = os.path.basename(os.path.normpath(file_path))
             seq_num = 0
-            file_size = os.path.getsize(file_path)
-            
-            print(f"🔍 File: {filename}, Size: {file_size/1024:.2f} KiB")
-            
+            stripe_start = stripe_end = None
+            if tree is not None:
+                file_size = tree.size
+                print(f"🔍 Files: {len(tree.entries)} under {filename}, Size: {file_size/1024:.2f} KiB")
+                # The server learns each file from its metadata packet, sizes and all
+                options = {"tree": len(tree.entries)}
+            elif stripe is not None:
+                # One byte range of the file, with its own socket, window and sequence space
+                index, count = stripe
+                total_size = os.path.getsize(file_path)
+                stripe_start, stripe_end = self.stripe_range(total_size, index, count)
+                file_size = stripe_end - stripe_start
+                print(f"🔍 File: {filename}, stripe {index + 1}/{count}: bytes {stripe_start}-{stripe_end} "
+                      f"of {total_size/1024:.2f} KiB")
+                options = {"size": file_size, "stripe": f"{index}/{count}", "offset": stripe_start, "total": total_size}
+            elif stream is not None:
+                file_size = None  # Known once the source ends
+                print(f"🔍 Stream: {filename}, Size: unknown")
+                options = {}
+            else:
+                file_size = os.path.getsize(file_path)
+                print(f"🔍 File: {filename}, Size: {file_size/1024:.2f} KiB")
+                # Filename, then NUL-separated options; the size lets the server preallocate the file
+                options = {"size": file_size}
+            # Chunk size: the largest the path carries, the server may lower it
+            self.chunk_size = self.probe_chunk_size()
+            if self.chunk_size != self.BUFFER_SIZE:
+                options["chunk"] = self.chunk_size
+            if tree is not None:
+                tree.layout(self.chunk_size)
+                if not self.fits_sequence_space(len(tree)):
+                    return False
+            elif file_size is not None and not self.fits_sequence_space((file_size + self.chunk_size - 1) // self.chunk_size):
+                return False
+            if self.compress:
+                offered = ChunkCompressor.available() if self.compress == "auto" else [self.compress]
+                options["compress"] = ",".join(offered)
+            precomputed_digest = None
+            if self.resume and (tree is not None or stripe is not None or stream is not None):
+                print("ℹ️ Resume only applies to single unstriped files, sending everything")
+            elif self.resume:
+                # The file digest doubles as the file's identity for the server's resume state
+                print("🔍 Hashing file to identify it for resume...")
+                precomputed_digest = self.digest_file(file_path)
+                options["id"] = precomputed_digest.hexdigest()
+            # Unique per transfer, so the server tells our handshake retries apart from sending the same file again
+            options["nonce"] = os.urandom(8).hex()
+            handshake =filename.encode('utf-8') + b"".join(f"\0{key}={value}".encode() for key, value in options.items())
+            accepted = {}
+            held = []  # [first, last] ranges the server already has from an earlier attempt
+
             # Send filename with sequence number
             attempts = 0
             while attempts < 5:  # Try 5 times to send filename
-                self.client_socket.sendto(struct.pack("!I", seq_num) + filename.encode('utf-8'), (self.host, self.port))
+                handshake_time = time.time()
+                self.send_packet(seq_num, handshake)
                 self.packets_sent += 1
                 
                 # Wait for filename ACK
                 try:
-                    ack, _ = self.client_socket.recvfrom(4)
-                    ack_num = struct.unpack("!I", ack)[0]
+                    ack, _ = self.client_socket.recvfrom(self.ACK_BUFFER_SIZE)
+                    ack_num, flags, _ = ACK_HEADER.unpack_from(ack)
+                    if flags & FLAG_ABORT:
+                        print("❌ Server refused the transfer, the file is already being received from another client")
+                        return False
+                    if flags & FLAG_BUSY:
+                        print("❌ Server is busy with too many transfers, try again later")
+                        return False
                     if ack_num == seq_num:
+                        if attempts == 0:
+                            self.rtt.on_sample(time.time() - handshake_time)
+                        # The server answers with the options it accepted, after any held ranges
+                        block_count = ack[ACK_HEADER.size - 1]
+                        held = [SACK_BLOCK.unpack_from(ack, ACK_HEADER.size + i * SACK_BLOCK.size)
+                                for i in range(block_count)]
+                        accepted = self.parse_options(ack[ACK_HEADER.size + block_count * SACK_BLOCK.size:])
+                        if tree is not None and "tree" not in accepted:
+                            print("❌ Server does not support multi-file sessions")
+                            return False
+                        if "rcvbuf" in accepted:
+                            # Receive window: what the server's socket buffer holds, the kernel
+                            # charges roughly twice the payload for each queued datagram
+                            self.cc.receive_window = max(CongestionController.MIN_WINDOW,
+                                                         int(accepted["rcvbuf"]) // (2 * (self.chunk_size + self.PACKET_OVERHEAD)))
                         break
                     else:
                         print(f"⚠️ Unexpected ACK for filename: {ack_num}")
@@ -51,107 +951,310 @@ class TCPficationClient:
             
             if attempts == 5:
                 print("❌ Failed to establish connection after 5 attempts")
-                return
+                return False
+
+            proposed_chunk_size = self.chunk_size
+            self.chunk_size = int(accepted.get("chunk", self.BUFFER_SIZE))  # Older servers only know BUFFER_SIZE
+            if self.chunk_size != proposed_chunk_size:
+                print(f"ℹ️ Server settled on {self.chunk_size}-byte chunks")
+                if precomputed_digest is not None:
+                    precomputed_digest = self.digest_file(file_path)  # Leaves depend on the chunking
+            if tree is not None:
+                tree.layout(self.chunk_size)
             
             base_seq_num = 1  # First packet sequence number
             next_seq_num = 1  # Next sequence number to use
-            window = {}       # Dictionary to track unacknowledged packets: {seq_num: (packet_data, sent_time)}
+            window = {}       # Dictionary to track unacknowledged packets: {seq_num: (payload, sent_time)}
+            timers = []       # Min-heap of retransmission deadlines: (deadline, seq_num, sent_time)
+            sack_seen = {}    # SACK block start -> highest sequence already processed for it
+            dup_counts = {}   # Number of ACKs that reported each unacknowledged packet missing
+            fast_retransmitted = set()  # Packets already fast-retransmitted since their last timeout
+
+            def retransmit(seq, now, trigger):
+                payload = window[seq][0]
+                self.send_packet(seq | seq_flags.get(seq, 0), payload)
+                self.packets_sent += 1
+                self.bytes_sent += len(payload)
+                self.retransmissions += 1
+                if tracer is not None:
+                    tracer.event("transport:packet_sent", {"packet_number": seq, "length": len(payload), "trigger": trigger})
+                window[seq] = (payload, now)
+                heapq.heappush(timers, (now + self.rtt.rto, seq, now))
+                retry_counts[seq] = retry_counts.get(seq, 0) + 1
+                if pacer is not None:
+                    pacer.consume(len(payload) + self.PACKET_OVERHEAD)
             
             start_time = time.time()
             last_status_time = start_time
             print(f"🚀 Starting file transfer: {filename}")
             
-            with open(file_path, 'rb') as file:
-                # Read all chunks into memory for easier pipelining
-                chunks = []
-                while chunk := file.read(self.BUFFER_SIZE):
-                    chunks.append(chunk)
+            # File digest: BLAKE2b over the per-chunk BLAKE2b leaves in sequence order, built while sending
+            # so the file is never read twice; the receiver builds the same tree from out-of-order writes
+            file_digest = precomputed_digest or hashlib.blake2b(digest_size=32)
+            if "resume" not in accepted:
+                held = []  # Older server, it knows nothing about resuming
+            elif held:
+                print(f"♻️ Resuming: the server already has {accepted['resume']} chunks")
+
+            parity = ParityEncoder(self.fec, self.chunk_size) if self.fec else None
+            pacer = Pacer(self.chunk_size + self.PACKET_OVERHEAD) if self.pacing else None
+            compressor = None
+            if "compress" in accepted:
+                compressor = ChunkCompressor(accepted["compress"])
+                print(f"🗜️ Compressing with {accepted['compress']}")
+            elif self.compress:
+                print("ℹ️ Server does not support any offered codec, sending uncompressed")
+            seq_flags = {}  # Sequence field flags of packets in the window (compressed, file metadata)
+            self.in_flight, self.parity, self.compressor, self.pacer = window, parity, compressor, pacer
+            tracer = self.tracer
+
+            with open(file_path, 'rb') if tree is None and stream is None else contextlib.nullcontext() as file:
+                # Payloads are sliced from the file lazily, nothing is loaded up front
+                if stream is not None:
+                    chunks = StreamChunks(stream, self.chunk_size)
+                elif tree is not None:
+                    chunks = tree
+                else:
+                    chunks = FileChunks(file, self.chunk_size, self.USE_MMAP, stripe_start or 0, stripe_end)
                 
                 chunk_index = 0
-                total_chunks = len(chunks)
+                total_chunks = len(chunks)  # Grows while a stream is being read
+                if not self.fits_sequence_space(total_chunks):
+                    return False  # The server settled on smaller chunks than we checked with
                 retry_counts = {}  # Track retries per packet
+                abort_reason = None  # Set when the transfer has to be given up
+                last_progress_time = start_time  # Last time an ACK covered new data, or nothing was in flight
                 
-                while chunk_index < total_chunks or window:
-                    # Send packets to fill the window
-                    while len(window) < self.WINDOW_SIZE and chunk_index < total_chunks:
+                while chunk_index < total_chunks or window or (stream is not None and not chunks.exhausted(chunk_index)):
+                    if stream is not None:
+                        total_chunks = len(chunks)
+                        if total_chunks >= SEQ_MASK:
+                            abort_reason = f"the stream is longer than the {SEQ_MASK - 1} chunks one transfer can number"
+                            break
+                    # Send packets to fill the window, as one burst
+                    burst = []
+                    send_time = time.time()
+                    if pacer is not None:
+                        pacer.update(self.cc.window_size, self.rtt.srtt, self.cc.in_slow_start)
+                        pacer.refill(send_time)
+                    while (len(window) < self.cc.window_size and chunk_index < total_chunks
+                           and (pacer is None or pacer.ready())):
+                        if held and held[0][0] <= next_seq_num:
+                            # Kept by the server from an interrupted attempt, jump over the range
+                            _, last = held.pop(0)
+                            resume_at = min(max(last + 1, next_seq_num), total_chunks + 1)
+                            if parity is not None:
+                                # Parity blocks cover consecutive packets only
+                                parity_packet = parity.flush()
+                                if parity_packet is not None:
+                                    burst.append(parity_packet)
+                            self.resumed_bytes += min(file_size, (resume_at - 1) * self.chunk_size) - chunk_index * self.chunk_size
+                            next_seq_num = resume_at
+                            chunk_index = resume_at - 1
+                            if compressor is not None:
+                                compressor.seek(chunk_index)
+                            continue
                         seq_num = next_seq_num
                         chunk = chunks[chunk_index]
-                        packet = struct.pack("!I", seq_num) + chunk
-                        self.client_socket.sendto(packet, (self.host, self.port))
-                        self.packets_sent += 1
-                        window[seq_num] = (packet, time.time())
+                        payload = chunk
+                        meta = tree is not None and tree.is_meta(chunk_index)
+                        if meta:
+                            seq_flags[seq_num] = META_FLAG
+                            if parity is not None:
+                                # Keep parity to data packets, a rebuilt packet would lose its flags
+                                parity_packet = parity.flush()
+                                if parity_packet is not None:
+                                    burst.append(parity_packet)
+                        if compressor is not None:
+                            payload, compressed = compressor.take(chunks, chunk_index)
+                            if compressed:
+                                seq_flags[seq_num] = seq_flags.get(seq_num, 0) | COMPRESSED_FLAG
+                        burst.append((seq_num | seq_flags.get(seq_num, 0), payload))
+                        if pacer is not None:
+                            pacer.consume(len(payload) + self.PACKET_OVERHEAD)
+                        if precomputed_digest is None:
+                            file_digest.update(hashlib.blake2b(chunk, digest_size=LEAF_DIGEST_SIZE).digest())
+                        window[seq_num] = (payload, send_time)
+                        heapq.heappush(timers, (send_time + self.rtt.rto, seq_num, send_time))
                         retry_counts[seq_num] = 0  # Initialize retry counter
                         next_seq_num += 1
                         chunk_index += 1
+                        if parity is not None and not meta:
+                            # Parity rides along with the data and is never acknowledged or resent
+                            parity.adapt(self.retransmissions / max(1, self.packets_sent))
+                            parity_packet = parity.add(seq_num, chunk)
+                            if (parity_packet is None and chunk_index == total_chunks
+                                    and (stream is None or chunks.exhausted(chunk_index))):
+                                parity_packet = parity.flush()
+                            if parity_packet is not None:
+                                burst.append(parity_packet)
+                        if stream is not None:
+                            chunks.release(chunk_index)
+                    if burst:
+                        self.send_burst(burst)
+                        self.packets_sent += len(burst)
+                        self.bytes_sent += sum(len(payload) for _, payload in burst)
+                        if tracer is not None:
+                            for seq, payload in burst:
+                                tracer.event("transport:packet_sent", {"packet_number": seq & SEQ_MASK,
+                                                                       "flags": seq >> FLAG_SHIFT, "length": len(payload)})
+                    if compressor is not None:
+                        # Keep the pool busy with the chunks the next refill will need
+                        compressor.schedule(chunks, chunk_index + self.cc.window_size)
                     
                     # Try to receive ACKs with longer timeout when window is full
                     # This ensures we don't move forward too quickly
-                    if len(window) >= self.WINDOW_SIZE or chunk_index >= total_chunks:
-                        self.client_socket.settimeout(0.1)  # Longer timeout when waiting is important
+                    if stream is not None and chunk_index >= total_chunks:
+                        wait = 0.005 if window else 0.0  # The source is behind: check back for its next chunk soon
+                    elif len(window) >= self.cc.window_size or chunk_index >= total_chunks:
+                        wait = 0.1  # Longer timeout when waiting is important
+                    elif pacer is not None and not pacer.ready():
+                        wait = max(min(0.01, pacer.delay(time.time())), 0.0005)  # Wake up when the next packet may go
                     else:
-                        self.client_socket.settimeout(0.01)  # Shorter for quick polling
+                        wait = 0.01  # Shorter for quick polling
+                    # Never sleep past the next retransmission deadline
+                    if timers:
+                        wait = min(wait, max(timers[0][0] - time.time(), 0.001))
+                    self.client_socket.settimeout(wait)
                     
                     # Process acknowledgments
                     try_receive = True
                     receive_start = time.time()
                     
-                    # Try to receive multiple ACKs if available (up to 100ms worth of checking)
-                    while try_receive and (time.time() - receive_start < 0.1):
+                    # Try to receive multiple ACKs if available (until the wait deadline)
+                    while try_receive and (time.time() - receive_start < wait):
                         try:
-                            ack, _ = self.client_socket.recvfrom(4)
-                            ack_num = struct.unpack("!I", ack)[0]
-                            
-                            # If we get an ACK, remove it from the window and reset retry counter
-                            if ack_num in window:
-                                del window[ack_num]
-                                if ack_num in retry_counts:
-                                    del retry_counts[ack_num]
-                                
-                            # Update base sequence number if possible
-                            if ack_num == base_seq_num:
+                            ack, _ = self.client_socket.recvfrom(self.ACK_BUFFER_SIZE)
+                            cum_ack, flags, block_count = ACK_HEADER.unpack_from(ack)
+                            if flags & FLAG_ABORT:
+                                abort_reason = "the server cancelled the transfer, a newer attempt took it over"
+                                break
+                            blocks = [SACK_BLOCK.unpack_from(ack, ACK_HEADER.size + i * SACK_BLOCK.size)
+                                      for i in range(block_count)]
+                            if tracer is not None:
+                                tracer.event("transport:packet_received", {"packet_type": "ack", "cumulative_ack": cum_ack,
+                                                                           "sack_blocks": blocks})
+
+                            # Everything up to the cumulative ACK has arrived
+                            newly_acked = []
+                            while base_seq_num <= cum_ack:
+                                if base_seq_num in window:
+                                    newly_acked.append(base_seq_num)
                                 base_seq_num += 1
-                                # Move base forward if consecutive packets are already acknowledged
-                                while base_seq_num < next_seq_num and base_seq_num not in window:
-                                    base_seq_num += 1
-                        except socket.timeout:
+
+                            # SACK blocks: only walk the part of each range we have not processed yet
+                            for start, end in blocks:
+                                seen = sack_seen.get(start, start - 1)
+                                for sacked in range(max(seen + 1, base_seq_num), end + 1):
+                                    if sacked in window:
+                                        newly_acked.append(sacked)
+                                sack_seen[start] = max(seen, end)
+                            if len(sack_seen) > 4 * len(blocks) + 16:
+                                sack_seen = {start: end for start, end in sack_seen.items() if end >= base_seq_num}
+
+                            if newly_acked:
+                                last_progress_time = time.time()
+                                # Karn's rule: only packets sent exactly once give an unambiguous RTT sample
+                                fresh = [acked for acked in newly_acked if retry_counts.get(acked) == 0]
+                                if fresh:
+                                    self.rtt.on_sample(time.time() - window[max(fresh)][1])
+                                for acked in newly_acked:
+                                    del window[acked]
+                                    seq_flags.pop(acked, None)
+                                    retry_counts.pop(acked, None)
+                                    dup_counts.pop(acked, None)
+                                    fast_retransmitted.discard(acked)
+                                self.cc.on_ack(len(newly_acked))
+                                if tracer is not None:
+                                    tracer.event("recovery:metrics_updated", {
+                                        "congestion_window": self.cc.window_size, "packets_in_flight": len(window),
+                                        "smoothed_rtt": (self.rtt.srtt or 0.0) * 1000, "rto": self.rtt.rto * 1000})
+
+                            # Holes below a SACK block: retransmit once enough ACKs have reported them
+                            hole_start = base_seq_num
+                            for start, end in blocks:
+                                for missing in range(hole_start, start):
+                                    if missing in window and missing not in fast_retransmitted:
+                                        dup_counts[missing] = dup_counts.get(missing, 0) + 1
+                                        if dup_counts[missing] >= self.DUP_ACK_THRESHOLD:
+                                            if DEVMODE:
+                                                print(f"⚡ Fast retransmit of packet {missing}")
+                                            if tracer is not None:
+                                                tracer.event("recovery:packet_lost", {"packet_number": missing,
+                                                                                      "trigger": "reordering_threshold"})
+                                            self.cc.on_loss(missing, next_seq_num)
+                                            fast_retransmitted.add(missing)
+                                            dup_counts[missing] = 0
+                                            retransmit(missing, time.time(), "retransmit_reordered")
+                                            self.fast_retransmissions += 1
+                                hole_start = max(hole_start, end + 1)
+
+                            # Drain whatever else is queued without blocking, then go refill the window
+                            self.client_socket.settimeout(0.0)
+                        except (socket.timeout, BlockingIOError):
                             try_receive = False  # Exit receive loop on timeout
+                    # Sends wait for room in the socket buffer again, the drain left it non-blocking
+                    self.client_socket.settimeout(self.TIMEOUT)
+                    if abort_reason is not None:
+                        break
                     
-                    # Check for timeouts and resend 
+                    # Check for timeouts and resend, popping only expired timers from the heap
                     current_time = time.time()
-                    for seq_num, (packet, send_time) in list(window.items()):
-                        if current_time - send_time > self.TIMEOUT:
-                            if retry_counts.get(seq_num, 0) < self.MAX_RETRIES:
-                                if DEVMODE:
-                                    print(f"⚠️ Timeout, resending packet {seq_num} (retry {retry_counts.get(seq_num, 0)+1}/{self.MAX_RETRIES})")
-                                self.client_socket.sendto(packet, (self.host, self.port))
-                                self.packets_sent += 1
-                                self.retransmissions += 1
-                                window[seq_num] = (packet, current_time)
-                                retry_counts[seq_num] = retry_counts.get(seq_num, 0) + 1
-                            else:
-                                # CRITICAL FIX: Send termination marker for packets that reached max retries
-                                # This helps the server know not to expect this packet anymore
-                                print(f"❌ Maximum retries reached for packet {seq_num}, sending SKIP marker")
-                                self.lost_packets.add(seq_num)
-                                # Send special SKIP marker to server so it knows to skip this sequence number
-                                skip_packet = struct.pack("!I", seq_num) + b"SKIP_PACKET"
-                                for _ in range(3):  # Send multiple times to ensure delivery
-                                    self.client_socket.sendto(skip_packet, (self.host, self.port))
-                                # Remove from window to unblock transfer
-                                del window[seq_num]
-                                if seq_num in retry_counts:
-                                    del retry_counts[seq_num]
+                    while timers and timers[0][0] <= current_time:
+                        _, seq_num, timer_sent_time = heapq.heappop(timers)
+                        entry = window.get(seq_num)
+                        if entry is None or entry[1] != timer_sent_time:
+                            continue  # Stale timer: packet was acknowledged or already resent
+                        self.rtt.backoff(current_time)
+                        if tracer is not None:
+                            tracer.event("recovery:packet_lost", {"packet_number": seq_num, "trigger": "time_threshold"})
+                        if self.cc.on_loss(seq_num, next_seq_num) and DEVMODE:
+                            print(f"📉 Loss detected at packet {seq_num}, window reduced to {self.cc.window_size}")
+                        if retry_counts.get(seq_num, 0) < self.MAX_RETRIES:
+                            if DEVMODE:
+                                print(f"⚠️ Timeout, resending packet {seq_num} (retry {retry_counts.get(seq_num, 0)+1}/{self.MAX_RETRIES})")
+                            fast_retransmitted.discard(seq_num)
+                            retransmit(seq_num, current_time, "retransmit_timeout")
+                        else:
+                            # CRITICAL FIX: Send termination marker for packets that reached max retries
+                            # This helps the server know not to expect this packet anymore
+                            print(f"❌ Maximum retries reached for packet {seq_num}, sending SKIP marker")
+                            self.lost_packets.add(seq_num)
+                            if tracer is not None:
+                                tracer.event("urft:packet_skipped", {"packet_number": seq_num})
+                            # Send a SKIP control frame so the server knows to skip this sequence number
+                            for _ in range(3):  # Send multiple times to ensure delivery
+                                self.send_packet(CONTROL_FLAG | seq_num, bytes([CONTROL_SKIP]))
+                            # Remove from window to unblock transfer
+                            del window[seq_num]
+                            seq_flags.pop(seq_num, None)
+                            if seq_num in retry_counts:
+                                del retry_counts[seq_num]
+                            dup_counts.pop(seq_num, None)
+                            fast_retransmitted.discard(seq_num)
+
+                    # Per-packet retries back off for minutes, give up on a peer that stopped answering
+                    if not window:
+                        last_progress_time = current_time
+                    elif current_time - last_progress_time > self.IDLE_TIMEOUT:
+                        abort_reason = f"no acknowledgment from the server for {self.IDLE_TIMEOUT:g} seconds"
+                        break
                     
                     # Wait a bit to prevent CPU overload
-                    if not window:  # If window is empty, wait longer
+                    if not window and stream is not None:
+                        chunks.wait(chunk_index, 0.1)  # Nothing in flight: sleep until the source has more
+                    elif not window:  # If window is empty, wait longer
                         time.sleep(0.01)
                         
                     # Print status update periodically
                     current_time = time.time()
+                    if self.metrics_log is not None:
+                        self.metrics_log.tick(current_time)
                     if current_time - last_status_time >= self.STATUS_INTERVAL:
-                        progress = min(chunk_index / total_chunks * 100, 100.0)
+                        # A stream's length is unknown, its bar shows how much of what was read so far is sent
+                        progress = min(chunk_index / total_chunks * 100, 100.0) if total_chunks else 0.0
                         elapsed = current_time - start_time
-                        speed = (chunk_index * self.BUFFER_SIZE) / elapsed / 1024 if elapsed > 0 else 0
+                        speed = (chunk_index * self.chunk_size) / elapsed / 1024 if elapsed > 0 else 0
                         retry_rate = (self.retransmissions / max(1, self.packets_sent)) * 100
                         
                         # Create progress bar
@@ -161,51 +1264,93 @@ class TCPficationClient:
                         
                         print(f"📊 Progress: [{bar}] {progress:.1f}% | "
                             f"Speed: {speed:.2f} KiB/s | "
-                            f"Window: {len(window)}/{self.WINDOW_SIZE} | "
+                            f"Window: {len(window)}/{self.cc.window_size} | "
+                            f"RTO: {self.rtt.rto*1000:.0f} ms | "
                             f"Retries: {self.retransmissions} ({retry_rate:.1f}%)")
                         
                         last_status_time = current_time
+
+                chunk = payload = None
+                if compressor is not None:
+                    compressor.close()
+                if stream is not None:
+                    file_size = chunks.size
+                chunks.close()
+            if abort_reason is not None:
+                print(f"❌ Transfer aborted: {abort_reason}")
+                return False
             
-            # Reset timeout for EOF handling
-            self.client_socket.settimeout(self.TIMEOUT)
-            
-            # Send EOF with last sequence number
+            # EOF waits start at the RTO and double on every timeout, so a short loss burst at the
+            # end cannot use up the attempts; all of them together stay within IDLE_TIMEOUT
+            eof_timeout = self.rtt.rto
+            eof_deadline = time.time() + self.IDLE_TIMEOUT
+
+            # Send EOF with last sequence number and the file digest for the server to check
             eof_attempts = 0
             eof_seq_num = next_seq_num
+            checksum = file_digest.hexdigest()
+            verified = None  # Unknown until the server acknowledges EOF
             print("🏁 Finalizing transfer...")
             while eof_attempts < 10:  # Try 10 times
+                remaining = eof_deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.client_socket.settimeout(min(eof_timeout, remaining))
                 # Include lost packet information in EOF message
                 lost_packet_data = ",".join(map(str, sorted(self.lost_packets))) if self.lost_packets else "NONE"
-                eof_message = f"EOF:{lost_packet_data}"
+                eof_message = bytes([CONTROL_EOF]) + f"{lost_packet_data}:{checksum}".encode()
                 
-                self.client_socket.sendto(struct.pack("!I", eof_seq_num) + eof_message.encode(), (self.host, self.port))
+                self.send_packet(CONTROL_FLAG | eof_seq_num, eof_message)
                 self.packets_sent += 1
+                self.bytes_sent += len(eof_message)
                 try:
-                    ack, _ = self.client_socket.recvfrom(4)
-                    ack_num = struct.unpack("!I", ack)[0]
+                    ack, _ = self.client_socket.recvfrom(self.ACK_BUFFER_SIZE)
+                    ack_num, flags, _ = ACK_HEADER.unpack_from(ack)
                     if ack_num == eof_seq_num:
+                        verified = not flags & FLAG_DIGEST_MISMATCH
                         break
                 except socket.timeout:
                     eof_attempts += 1
+                    eof_timeout *= 2
                     print(f"⚠️ Timeout, resending EOF packet {eof_seq_num} (attempt {eof_attempts}/10)")
+            self.client_socket.settimeout(self.TIMEOUT)
             
             elapsed = time.time() - start_time
             speed = file_size / elapsed / 1024 if elapsed > 0 else 0
             retry_rate = (self.retransmissions / max(1, self.packets_sent)) * 100
             
-            md5_hash = hashlib.md5()
-            with open(file_path, 'rb') as file:
-                for chunk in iter(lambda: file.read(self.BUFFER_SIZE), b''):
-                    md5_hash.update(chunk)
-            checksum = md5_hash.hexdigest()
-            
             print(f"\n📈 Transfer Summary for '{filename}':")
-            print(f"🔍 MD5 Checksum: {checksum}")
+            print(f"🔍 BLAKE2b digest: {checksum}")
+            if verified:
+                print("🔒 Integrity verified by the server")
+            elif verified is None:
+                print("⚠️ Server never acknowledged EOF, integrity unknown")
+            else:
+                print("❌ Integrity check failed: the server's copy does not match")
             print(f"✅ Transferred {file_size/1024:.2f} KiB in {elapsed:.2f} seconds")
-            print(f"📦 Total packets sent: {self.packets_sent}")
+            if tree is not None:
+                print(f"🗂️ Files sent: {len(tree.entries)}")
+            print(f"📦 Total packets sent: {self.packets_sent}" + (f" ({self.gso_sends} GSO sends)" if self.gso_sends else ""))
+            print(f"🔁 Retransmissions: {self.retransmissions} ({self.fast_retransmissions} fast)")
+            if self.send_drops:
+                print(f"🧱 Packets dropped by a full send queue: {self.send_drops}")
+            if parity is not None:
+                print(f"🧩 FEC parity packets sent: {parity.parity_sent}")
+            if self.resumed_bytes:
+                print(f"♻️ Skipped {self.resumed_bytes/1024:.2f} KiB the server kept from an earlier attempt")
+            if compressor is not None and compressor.raw_bytes:
+                print(f"🗜️ Compression: {compressor.raw_bytes/1024:.2f} KiB -> {compressor.wire_bytes/1024:.2f} KiB "
+                      f"({compressor.wire_bytes / compressor.raw_bytes * 100:.1f}%)")
+            if self.rtt.srtt is not None:
+                print(f"⏱️ Smoothed RTT: {self.rtt.srtt*1000:.2f} ms, RTO: {self.rtt.rto*1000:.0f} ms")
+            print(f"🪟 Congestion control: {self.cc.mode}, final window {self.cc.window_size}, loss events {self.cc.loss_events}"
+                  + (f", receive window {self.cc.receive_window}" if self.cc.receive_window < CongestionController.MAX_WINDOW else ""))
+            print(f"📏 Chunk size: {self.chunk_size} bytes, pacing {'on' if pacer is not None else 'off'}, "
+                  f"socket buffers: send {self.sndbuf // 1024} KiB, receive {self.rcvbuf // 1024} KiB")
             if self.lost_packets:
                 print(f"❌ Lost packets: {len(self.lost_packets)} ({', '.join(map(str, sorted(self.lost_packets)))})")
             print(f"📊 Speed: {speed:.2f} KiB/s")
+            return bool(verified)
             
         except FileNotFoundError:
             print(f"❌ Error: File '{file_path}' not found.")
@@ -213,18 +1358,107 @@ class TCPficationClient:
             print(f"❌ Error: {e}")
             import traceback
             traceback.print_exc()
+        return False
 
-def main():
-    if len(sys.argv) < 4:
-        print("Usage: python urft_client.py <file_path> <server_ip> <server_port>")
+def send_stripe(options, file_path, index, count) -> None:
+    # Entry point of one stripe's process, each stripe keeps its own trace, metrics log and metrics port
+    options = dict(options)
+    for name in ("trace", "metrics_log"):
+        if options.get(name):
+            options[name] = f"{options[name]}.{index}"
+    if options.get("metrics_port"):
+        options["metrics_port"] += index
+    client = TCPficationClient(**options)
+    try:
+        sent = client.send_file(file_path, stripe=(index, count))
+    finally:
+        client.close()
+    if not sent:
         sys.exit(1)
 
-    file_path = sys.argv[1]
-    server_ip = sys.argv[2]
-    server_port = int(sys.argv[3])
+def send_striped(options, file_path, streams) -> bool:
+    # Split one file into byte ranges sent in parallel by separate processes, each with its own
+    # socket (so its own flow and, with SO_REUSEPORT, possibly its own server worker)
+    total_chunks = (os.path.getsize(file_path) + TCPficationClient.BUFFER_SIZE - 1) // TCPficationClient.BUFFER_SIZE
+    if total_chunks:
+        # Drop stripes that would come out empty once the ranges are rounded to whole chunks
+        per_stripe = (total_chunks + streams - 1) // streams
+        streams = (total_chunks + per_stripe - 1) // per_stripe
+    else:
+        streams = 1
+    start_time = time.time()
+    processes = [multiprocessing.Process(target=send_stripe, args=(options, file_path, index, streams),
+                                         name=f"urft-stripe-{index}")
+                 for index in range(streams)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.time() - start_time
+    failed = [index + 1 for index, process in enumerate(processes) if process.exitcode != 0]
+    size = os.path.getsize(file_path)
+    print(f"\n🧵 {streams} stripes finished in {elapsed:.2f} seconds, "
+          f"{size / elapsed / 1024 if elapsed > 0 else 0:.2f} KiB/s overall")
+    if failed:
+        print(f"❌ Stripes failed: {', '.join(map(str, failed))}")
+        return False
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(usage="python urft_client.py <path> [<path> ...] <server_ip> <server_port> [options]")
+    parser.add_argument("paths", nargs="+", metavar="path",
+                        help="A file, or several files and directories sent together in one session")
+    parser.add_argument("server_ip")
+    parser.add_argument("server_port", type=int)
+    parser.add_argument("--cc", choices=CongestionController.MODES, default="cubic",
+                        help="Congestion control mode (default: cubic)")
+    parser.add_argument("--fec", metavar="K|auto",
+                        help="Send one XOR parity packet per K data packets, or adapt K to the loss rate")
+    parser.add_argument("--resume", action="store_true",
+                        help="Let the server keep a partial copy and continue an interrupted transfer")
+    parser.add_argument("--streams", type=int, default=1, metavar="N",
+                        help="Send a single file as N byte-range stripes over parallel sockets")
+    parser.add_argument("--mtu", default="auto", metavar="BYTES|auto",
+                        help="Path MTU to size packets for, or probe for jumbo frames (default: auto)")
+    parser.add_argument("--no-pacing", action="store_true",
+                        help="Send each window back to back instead of spreading it over the RTT")
+    parser.add_argument("--sndbuf", type=int, metavar="BYTES", help="Socket send buffer size")
+    parser.add_argument("--rcvbuf", type=int, metavar="BYTES", help="Socket receive buffer size")
+    parser.add_argument("--compress", choices=["auto"] + ChunkCompressor.available(),
+                        help="Compress chunks that shrink, with the given codec or the best one both sides support")
+    parser.add_argument("--qlog", metavar="PATH",
+                        help="Write a qlog (JSON-SEQ) trace of every packet event to PATH")
+    parser.add_argument("--metrics-log", metavar="PATH",
+                        help=f"Append a JSON snapshot of the metrics to PATH every {MetricsLog.INTERVAL:g} seconds")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the transfer "
+                             "(stripes use PORT + stripe index)")
+    args = parser.parse_args()
+    if args.fec not in (None, "auto") and not (args.fec.isdigit() and int(args.fec) >= ParityEncoder.MIN_BLOCK):
+        parser.error(f"--fec must be 'auto' or an integer >= {ParityEncoder.MIN_BLOCK}")
+
+    if args.streams < 1:
+        parser.error("--streams must be at least 1")
+    if args.mtu != "auto" and not (args.mtu.isdigit() and 576 <= int(args.mtu) <= 65535):
+        parser.error("--mtu must be 'auto' or a number of bytes between 576 and 65535")
 
-    client = TCPficationClient(host=server_ip, port=server_port)
-    client.send_file(file_path)
+    options = dict(host=args.server_ip, port=args.server_port, cc_mode=args.cc, fec=args.fec,
+                   compress=args.compress, resume=args.resume, mtu=args.mtu, pacing=not args.no_pacing,
+                   sndbuf=args.sndbuf, rcvbuf=args.rcvbuf, trace=args.qlog, metrics_log=args.metrics_log,
+                   metrics_port=args.metrics_port)
+    if args.streams > 1:
+        if len(args.paths) != 1 or not os.path.isfile(args.paths[0]):
+            parser.error("--streams needs exactly one regular file")
+        if not send_striped(options, args.paths[0], args.streams):
+            sys.exit(1)
+        return
+    client = TCPficationClient(**options)
+    try:
+        sent = client.send_files(args.paths)
+    finally:
+        client.close()
+    if not sent:
+        sys.exit(1)
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MetricsRegistry:
+    # Counters and gauges are read from the objects that already keep them, only when a snapshot
+    # is taken, so the send and receive loops pay nothing for metrics. A source is a callable
+    # returning [(name, labels, value), ...]; every name is described once with its type and help.
+    KINDS = ("counter", "gauge")
+
+    def __init__(self, prefix) -> None:
+        self.prefix: str = prefix
+        self.families = {}  # name -> (kind, help)
+        self.sources = []
+
+    def describe(self, families) -> None:
+        # families: [(name, kind, help), ...]
+        for name, kind, help_text in families:
+            if kind not in self.KINDS:
+                raise ValueError(f"Unknown metric type: {kind} (choose from {', '.join(self.KINDS)})")
+            self.families[name] = (kind, help_text)
+
+    def add_source(self, source) -> None:
+        self.sources.append(source)
+
+    def remove_source(self, source) -> None:
+        if source in self.sources:
+            self.sources.remove(source)
+
+    def collect(self) -> list:
+        samples = []
+        for source in list(self.sources):
+            samples.extend(source())
+        return samples
+
+    def snapshot(self) -> dict:
+        # Unlabelled metrics map to their value, labelled ones to a list of {labels..., "value": v}
+        metrics = {}
+        for name, labels, value in self.collect():
+            if labels:
+                metrics.setdefault(name, []).append({**labels, "value": value})
+            else:
+                metrics[name] = value
+        return {"timestamp": time.time(), "pid": os.getpid(), "metrics": metrics}
+
+    @staticmethod
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    def prometheus(self) -> str:
+        # Prometheus text exposition format, one HELP/TYPE block per metric family
+        grouped = {}
+        for name, labels, value in self.collect():
+            grouped.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, samples in grouped.items():
+            kind, help_text = self.families.get(name, ("gauge", ""))
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{self.escape(label)}"' for key, label in labels.items())
+                lines.append(f"{full_name}{{{label_text}}} {value}" if label_text else f"{full_name} {value}")
+        return "\n".join(lines) + "\n"
+
+class BackgroundWriter:
+    # Appends records to a file from a daemon thread. Callers only append to a deque, which is
+    # thread-safe and cheap; encoding and the write system calls happen off the hot loop.
+    FLUSH_INTERVAL: float = 0.2  # seconds between writes of the queued records
+    MAX_QUEUE: int = 1_000_000  # records held before new ones are dropped, bounds memory if the disk stalls
+
+    def __init__(self, path, encode, header=None) -> None:
+        self.path: str = path
+        self.encode = encode  # record -> str
+        self.queue: deque = deque()
+        self.dropped = 0
+        self.file = open(path, "w", buffering=1024 * 1024)
+        if header is not None:
+            self.file.write(header)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"urft-writer-{os.path.basename(path)}", daemon=True)
+        self.thread.start()
+
+    def write(self, record) -> None:
+        if len(self.queue) < self.MAX_QUEUE:
+            self.queue.append(record)
+        else:
+            self.dropped += 1
+
+    def drain(self) -> None:
+        queue = self.queue
+        while queue:
+            self.file.write(self.encode(queue.popleft()))
+        self.file.flush()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.FLUSH_INTERVAL):
+            self.drain()
+
+    def close(self) -> None:
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.drain()
+        self.file.close()
+
+class EventTracer:
+    # Per-packet event trace in the qlog JSON-SEQ format (one RFC 7464 record per event), so
+    # qvis and other qlog tools can read it. Recording an event is a deque append of a tuple.
+    QLOG_VERSION: str = "0.3"
+    RECORD_SEPARATOR: str = "\x1e"
+
+    def __init__(self, path, vantage_point, title="urft") -> None:
+        self.start: float = time.time()
+        header = {
+            "qlog_version": self.QLOG_VERSION,
+            "qlog_format": "JSON-SEQ",
+            "title": title,
+            "trace": {
+                "vantage_point": {"type": vantage_point},
+                "common_fields": {"time_format": "relative", "reference_time": self.start * 1000, "protocol_type": ["URFT"]},
+            },
+        }
+        self.writer: BackgroundWriter = BackgroundWriter(path, self.encode, self.RECORD_SEPARATOR + json.dumps(header) + "\n")
+
+    def encode(self, record) -> str:
+        timestamp, name, data = record
+        return (self.RECORD_SEPARATOR
+                + json.dumps({"time": round((timestamp - self.start) * 1000, 3), "name": name, "data": data})
+                + "\n")
+
+    def event(self, name, data) -> None:
+        self.writer.write((time.time(), name, data))
+
+    def close(self) -> None:
+        self.writer.close()
+        if self.writer.dropped:
+            print(f"⚠️ Trace queue overflowed, {self.writer.dropped} events were dropped from {self.writer.path}")
+
+class MetricsLog:
+    # Writes a JSON snapshot of the registry every `interval` seconds, driven by the caller's loop
+    INTERVAL: float = 2.0  # seconds
+
+    def __init__(self, registry, path, interval=None) -> None:
+        self.registry: MetricsRegistry = registry
+        self.interval: float = interval or self.INTERVAL
+        self.last_write: float = 0.0
+        self.writer: BackgroundWriter = BackgroundWriter(path, lambda snapshot: json.dumps(snapshot) + "\n")
+
+    def tick(self, now) -> None:
+        if now - self.last_write >= self.interval:
+            self.write(now)
+
+    def write(self, now=None) -> None:
+        # Values are collected here, on the caller's thread; encoding happens on the writer's
+        self.writer.write(self.registry.snapshot())
+        self.last_write = now or time.time()
+
+    def close(self) -> None:
+        self.write()  # Final values
+        self.writer.close()
+
+class MetricsServer:
+    # Serves the registry over HTTP: /metrics in the Prometheus text format, /metrics.json as a snapshot
+
+    def __init__(self, registry, host, port) -> None:
+        self.registry: MetricsRegistry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler) -> None:
+                if handler.path == "/metrics":
+                    body, content_type = registry.prometheus(), "text/plain; version=0.0.4"
+                elif handler.path == "/metrics.json":
+                    body, content_type = json.dumps(registry.snapshot()), "application/json"
+                else:
+                    handler.send_error(404)
+                    return
+                body = body.encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", content_type)
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args) -> None:
+                pass  # Scrapes would flood the transfer output
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port: int = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="urft-metrics", daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,44 @@
+import socket
+import struct
+
+# Wire format shared by the client and the server. Both sides import it from here so they cannot
+# drift apart.
+
+# Data packet: HEADER, then the payload. Flags live in the top bits of the sequence field.
+HEADER = struct.Struct("!II")  # sequence number, CRC32 of the payload seeded with the sequence number
+PARITY_FLAG: int = 0x80000000  # Sequence field flag: FEC parity packet, FEC_HEADER and the XOR of its block follow
+COMPRESSED_FLAG: int = 0x40000000  # Sequence field flag: payload is compressed with the negotiated codec
+META_FLAG: int = 0x20000000  # Sequence field flag: payload describes the next file of a multi-file session
+PROBE_FLAG: int = 0x10000000  # Sequence field flag: path MTU probe, echoed by the server with FLAG_PROBE
+CONTROL_FLAG: int = 0x08000000  # Sequence field flag: control frame, its first byte says which
+SEQ_MASK: int = 0x07FFFFFF  # Sequence number bits, the top bits are reserved for packet flags
+FLAG_SHIFT: int = 27  # Packet flags as a small number, for traces
+CONTROL_EOF: int = 1  # Control frame: end of transfer, "<lost packets|NONE>:<file digest>" follows
+CONTROL_SKIP: int = 2  # Control frame: the client gave up on this sequence number
+FEC_HEADER = struct.Struct("!HH")  # packets in the parity block, XOR of their payload lengths
+ENTRY_HEADER = struct.Struct("!Q")  # Tree entry: file size; the UTF-8 relative path follows
+
+# ACK frame: ACK_HEADER, then one SACK_BLOCK per received range past the cumulative ack
+ACK_HEADER = struct.Struct("!IBB")  # cumulative ack, flags, number of SACK blocks
+SACK_BLOCK = struct.Struct("!II")  # first and last sequence number of a received range
+FLAG_BUSY: int = 0x01  # ACK flag: handshake refused, the server has too many sessions
+FLAG_DIGEST_MISMATCH: int = 0x02  # EOF ACK flag: the server's file digest differs from the client's
+FLAG_PROBE: int = 0x04  # ACK flag: answer to a path MTU probe
+FLAG_ABORT: int = 0x08  # ACK flag: the server refused or cancelled the transfer, another one owns the file
+
+LEAF_DIGEST_SIZE: int = 16  # bytes of BLAKE2b per chunk in the file digest tree
+SOL_UDP: int = getattr(socket, "SOL_UDP", 17)
+
+def set_buffer(sock, option, size) -> int:
+    # Returns the size the kernel actually granted (Linux reports double, for its bookkeeping)
+    # The FORCE variants need CAP_NET_ADMIN but go past net.core.[rw]mem_max
+    force = getattr(socket, "SO_SNDBUFFORCE" if option == socket.SO_SNDBUF else "SO_RCVBUFFORCE", None)
+    for name in (force, option):
+        if name is None:
+            continue
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, name, size)
+            break
+        except OSError:
+            pass
+    return sock.getsockopt(socket.SOL_SOCKET, option)
@@ -4,219 +4,1324 @@ import sys
 import struct
 import time
 import hashlib
+import zlib
+import selectors
+import argparse
+import multiprocessing
+import bisect
+import queue
+import threading
+
+from urft_protocol import (HEADER, ACK_HEADER, SACK_BLOCK, FEC_HEADER, ENTRY_HEADER, FLAG_BUSY, FLAG_DIGEST_MISMATCH,
+                           FLAG_PROBE, FLAG_ABORT, PARITY_FLAG, COMPRESSED_FLAG, META_FLAG, PROBE_FLAG, CONTROL_FLAG,
+                           CONTROL_EOF, CONTROL_SKIP, SEQ_MASK, FLAG_SHIFT, LEAF_DIGEST_SIZE, SOL_UDP, set_buffer)
+from urft_metrics import MetricsRegistry, EventTracer, MetricsLog, MetricsServer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
 
 DEVMODE = False
 
+class ReceiveBitmap:
+    # One bit per sequence number, grown on demand. Tracks which packets have been written
+    # without keeping their payloads around.
+
+    def __init__(self, size=0) -> None:
+        self.bits = bytearray((size + 8) // 8)
+
+    def __contains__(self, seq) -> bool:
+        index = seq >> 3
+        return index < len(self.bits) and bool(self.bits[index] & (1 << (seq & 7)))
+
+    def add(self, seq) -> None:
+        index = seq >> 3
+        if index >= len(self.bits):
+            self.bits.extend(bytes(max(index + 1 - len(self.bits), len(self.bits))))
+        self.bits[index] |= 1 << (seq & 7)
+
+    def discard(self, seq) -> None:
+        index = seq >> 3
+        if index < len(self.bits):
+            self.bits[index] &= ~(1 << (seq & 7))
+
+    def ranges(self, start, end, limit) -> list:
+        # Up to `limit` [first, last] runs of present sequence numbers within [start, end]
+        ranges = []
+        seq = start
+        end = min(end, len(self.bits) * 8 - 1)
+        while seq <= end:
+            if seq & 7 == 0 and seq + 8 <= end + 1:
+                byte = self.bits[seq >> 3]
+                if byte == 0:
+                    seq += 8  # Whole byte missing
+                    continue
+                if byte == 0xFF:
+                    if ranges and ranges[-1][1] == seq - 1:
+                        ranges[-1][1] = seq + 7
+                    elif len(ranges) < limit:
+                        ranges.append([seq, seq + 7])
+                    else:
+                        break
+                    seq += 8
+                    continue
+            if seq in self:
+                if ranges and ranges[-1][1] == seq - 1:
+                    ranges[-1][1] = seq
+                elif len(ranges) < limit:
+                    ranges.append([seq, seq])
+                else:
+                    break
+            seq += 1
+        return ranges
+
+class StateWriter:
+    # Persists resume state off the event loop: fdatasync of the partial file, then an atomic
+    # replace of its state file. Jobs run in order on one thread, so the removal queued when a
+    # transfer completes always comes after that transfer's last save.
+
+    def __init__(self) -> None:
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="urft-state-writer", daemon=True)
+        self.thread.start()
+
+    def save(self, session, fd, state_path, state) -> None:
+        # Takes ownership of fd, a duplicate of the session's descriptor
+        self.jobs.put((session, fd, state_path, state))
+
+    def remove(self, state_path) -> None:
+        self.jobs.put((None, -1, state_path, None))
+
+    def run(self) -> None:
+        while (job := self.jobs.get()) is not None:
+            session, fd, state_path, state = job
+            try:
+                if state is None:
+                    if os.path.exists(state_path):
+                        os.remove(state_path)
+                    continue
+                try:
+                    # Data first: the bitmap must never claim chunks that are not on disk yet
+                    if hasattr(os, "fdatasync"):
+                        os.fdatasync(fd)
+                finally:
+                    os.close(fd)
+                temp_path = state_path + ".tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(state)
+                os.replace(temp_path, state_path)
+            except OSError as e:
+                print(f"⚠️ Could not save resume state {state_path}: {e}")
+            finally:
+                if session is not None:
+                    session.state_saving = False
+                self.jobs.task_done()
+        self.jobs.task_done()
+
+    def flush(self) -> None:
+        self.jobs.join()
+
+    def close(self) -> None:
+        self.jobs.put(None)
+        self.thread.join()
+
+class ReceiveSession:
+    # Reassembly state for one transfer. The server keeps one per sender address,
+    # so any number of uploads can be in progress on the same socket.
+    # Every payload is written straight to its final offset, (seq - 1) * chunk size,
+    # so out-of-order packets cost one bit in the bitmap instead of a buffered copy.
+
+    def __init__(self, server, file_path, sender_addr, file_size=None, codec=None, file_id=None, stripe=None,
+                 chunk_size=None) -> None:
+        self.server: TCPficationServer = server
+        self.chunk_size: int = chunk_size or server.BUFFER_SIZE  # Payload bytes per packet, agreed in the handshake
+        self.file_path: str = file_path
+        self.sender_addr = sender_addr
+        self.file_size: int | None = file_size  # Announced in the handshake, None for older clients
+        # Striped transfer: (index, count, byte offset, whole file size). Each stripe is its own
+        # session, possibly in another worker process, writing its byte range of the shared file.
+        self.stripe: tuple | None = stripe
+        self.base_offset: int = stripe[2] if stripe else 0
+        self.codec: str | None = codec  # Compression codec agreed in the handshake
+        self.compressed_count = 0
+        total_chunks = 0
+        if file_size:
+            total_chunks = (file_size + self.chunk_size - 1) // self.chunk_size
+        self.received = ReceiveBitmap(total_chunks + 1)
+
+        # Resumable transfers: the client identifies the file by its digest, and we keep the
+        # bitmap of what is already on disk next to the file until the transfer completes
+        self.file_id: bytes | None = file_id if file_size is not None and stripe is None else None
+        self.state_path: str | None = file_path + server.RESUME_SUFFIX if self.file_id else None
+        self.state_saved_time = time.time()
+        self.state_dirty = False
+        self.state_saving = False  # A save is queued on the server's state writer
+        saved = self.load_state()
+        self.fd: int = self.open_file(saved is not None)
+        if saved is not None:
+            self.received.bits[:len(saved)] = saved
+        self.resumed_count = int.from_bytes(saved, 'little').bit_count() if saved is not None else 0
+        # File digest: BLAKE2b over per-chunk leaves folded in sequence order as the in-order point
+        # advances; leaves of packets written ahead of it wait in pending_leaves
+        self.file_digest = hashlib.blake2b(digest_size=32)
+        self.pending_leaves = {}
+        self.verified: bool | None = None  # Outcome of the digest comparison at EOF
+        self.eof_flags = 0  # Flags of the EOF acknowledgment, repeated if the client retries
+        # Parity of FEC blocks that are still missing packets: first sequence -> (count, length XOR, payload XOR)
+        self.parity_blocks = {}
+        self.recovered_count = 0  # Packets rebuilt from parity instead of waiting for a retransmission
+
+        self.expected_seq_num = 1
+        self.highest_seq_num = 0  # Highest sequence number written so far
+        self.duplicate_count = 0
+        self.out_of_order_count = 0
+        self.dropped_count = 0  # Packets refused for running too far ahead of the in-order point or of their file's metadata
+        self.packets_received = 0
+        self.skipped_packets = set()  # Track packets that were explicitly skipped
+
+        self.start_time = time.time()
+        self.last_status_time = self.start_time
+        self.last_activity_time = self.start_time  # Last packet received, SESSION_TIMEOUT counts from here
+        self.last_nudge_time = self.start_time  # Last "connection appears lost" ACK
+        self.handshake: bytes = b""  # Payload of the handshake that opened the session, to recognise its retries
+        self.received_bytes = 0
+        self.acks_sent = 0
+        self.unacked_packets = 0  # In-order packets received since the last ACK
+        self.ack_deadline = None  # When the pending delayed ACK must go out
+
+        if self.resumed_count:
+            print(f"♻️ Resuming {os.path.basename(file_path)}: {self.resumed_count} chunks already on disk")
+            self.highest_seq_num = max((last for _, last in self.received.ranges(1, total_chunks, total_chunks + 1)), default=0)
+            self.advance()
+
+    def open_file(self, resuming) -> int:
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if self.stripe is not None:
+            # Sibling stripes write the same file concurrently, so never truncate it here
+            fd = os.open(self.file_path, flags, 0o644)
+            self.preallocate(fd, self.stripe[3])
+            return fd
+        fd = os.open(self.file_path, flags if resuming else flags | os.O_TRUNC, 0o644)
+        if self.file_size and not resuming:
+            self.preallocate(fd, self.file_size)
+        return fd
+
+    @staticmethod
+    def preallocate(fd, size) -> None:
+        try:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, size)
+                return
+        except OSError:
+            pass  # Filesystem without fallocate support
+        os.ftruncate(fd, size)
+
+    def write_at(self, offset, data, fd=None) -> None:
+        fd = self.fd if fd is None else fd
+        if hasattr(os, "pwrite"):
+            os.pwrite(fd, data, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, data)
+
+    def store(self, seq_num, data) -> bool:
+        # Write a new payload where it belongs; False if it cannot be placed yet
+        self.write_at(self.base_offset + (seq_num - 1) * self.chunk_size, data)
+        return True
+
+    def load(self, seq_num) -> bytes:
+        # Read a stored payload back, the file is preallocated so the last one comes back short
+        return self.read_at(self.base_offset + (seq_num - 1) * self.chunk_size,
+                            min(self.chunk_size, self.file_size - (seq_num - 1) * self.chunk_size)
+                            if self.file_size is not None else self.chunk_size)
+
+    def load_state(self):
+        # The saved bitmap if the state file describes this very file, else None
+        if self.state_path is None:
+            return None
+        try:
+            with open(self.state_path, 'rb') as f:
+                state = f.read()
+            file_id, file_size, chunk_size = self.server.RESUME_HEADER.unpack_from(state)
+        except (OSError, struct.error):
+            return None
+        if (file_id, file_size, chunk_size) != (self.file_id, self.file_size, self.chunk_size) or not os.path.exists(self.file_path):
+            return None
+        return state[self.server.RESUME_HEADER.size:self.server.RESUME_HEADER.size + len(self.received.bits)]
+
+    def save_state(self, force=False) -> None:
+        # Snapshot the bitmap and hand the sync and the write to the state writer thread.
+        # A periodic save waits for the previous one to finish instead of queueing behind it.
+        if self.state_path is None or self.fd < 0 or (self.state_saving and not force):
+            return
+        bits = bytearray(self.received.bits)
+        held = ReceiveBitmap()
+        held.bits = bits
+        for seq in self.skipped_packets:
+            held.discard(seq)  # Skipped chunks were never written
+        self.state_saving = True
+        self.server.save_state(self, self.server.RESUME_HEADER.pack(self.file_id, self.file_size, self.chunk_size) + bits)
+        self.state_saved_time = time.time()
+        self.state_dirty = False
+
+    def held_ranges(self, limit) -> list:
+        # Chunks already on disk, sent back in the handshake so the client skips them
+        return self.received.ranges(1, self.highest_seq_num, limit)
+
+    def read_at(self, offset, size, fd=None) -> bytes:
+        fd = self.fd if fd is None else fd
+        if hasattr(os, "pread"):
+            return os.pread(fd, size, offset)
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+
+    def decompress(self, data):
+        # Never inflate past one chunk, whatever the packet claims
+        limit = self.chunk_size
+        if self.codec == "zstd":
+            chunk = zstandard.ZstdDecompressor().decompress(data, max_output_size=limit)
+        elif self.codec == "lz4":
+            chunk = lz4.block.decompress(data, uncompressed_size=limit)
+        elif self.codec == "zlib":
+            inflater = zlib.decompressobj()
+            chunk = inflater.decompress(data, limit)
+            if inflater.unconsumed_tail or not inflater.eof:
+                raise ValueError("zlib payload is truncated or larger than a chunk")
+        else:
+            raise ValueError("compressed packet but no codec was negotiated")
+        if len(chunk) > limit:
+            raise ValueError(f"decompressed payload of {len(chunk)} bytes is larger than a chunk")
+        self.compressed_count += 1
+        return chunk
+
+    def handle_parity(self, first_seq, data, now) -> None:
+        self.last_activity_time = now
+        if len(data) < FEC_HEADER.size:
+            return
+        count, length_xor = FEC_HEADER.unpack_from(data)
+        if first_seq + count <= self.expected_seq_num or first_seq in self.parity_blocks:
+            return  # Whole block already here, or a duplicate parity packet
+        self.parity_blocks[first_seq] = (count, length_xor, bytes(data[FEC_HEADER.size:]))
+        self.try_recover(first_seq, now)
+
+    def try_recover(self, first_seq, now) -> None:
+        # Rebuild the block's only missing packet from the parity and the packets already on disk
+        count, length_xor, parity = self.parity_blocks[first_seq]
+        block = range(first_seq, first_seq + count)
+        missing = [seq for seq in block if seq not in self.received]
+        if len(missing) > 1:
+            return  # Wait for more of the block
+        del self.parity_blocks[first_seq]
+        if not missing or any(seq in self.skipped_packets for seq in block):
+            return  # Nothing to do, or a skipped hole would poison the XOR
+
+        chunk_size = self.chunk_size
+        xor = int.from_bytes(parity, 'big')
+        for seq in block:
+            if seq != missing[0]:
+                chunk = self.load(seq)
+                xor ^= int.from_bytes(chunk, 'big') << (8 * (chunk_size - len(chunk)))
+                length_xor ^= len(chunk)
+        if length_xor > chunk_size:
+            return  # Inconsistent block, leave it to retransmission
+        self.recovered_count += 1
+        if DEVMODE:
+            print(f"🧩 Recovered packet {missing[0]} from parity")
+        if self.server.tracer is not None:
+            self.server.tracer.event("urft:packet_recovered", {"peer": self.server.peer_name(self.sender_addr),
+                                                                "packet_number": missing[0]})
+        self.handle_packet(missing[0], xor.to_bytes(chunk_size, 'big')[:length_xor], now)
+
+    def next_deadline(self) -> float:
+        deadlines = [self.last_status_time + self.server.STATUS_INTERVAL,
+                     max(self.last_activity_time, self.last_nudge_time) + self.server.INACTIVITY_TIMEOUT]
+        if self.ack_deadline is not None:
+            deadlines.append(self.ack_deadline)
+        return min(deadlines)
+
+    def sack_blocks(self) -> list:
+        # Received ranges above the in-order point, lowest first
+        return self.received.ranges(self.expected_seq_num + 1, self.highest_seq_num, self.server.MAX_SACK_BLOCKS)
+
+    def flush_ack(self) -> None:
+        self.server.send_ack(self.expected_seq_num - 1, self.sender_addr, self.sack_blocks())
+        self.acks_sent += 1
+        self.unacked_packets = 0
+        self.ack_deadline = None
+
+    def on_timer(self, now) -> None:
+        # Check for inactivity timeout
+        if now - max(self.last_activity_time, self.last_nudge_time) > self.server.INACTIVITY_TIMEOUT:
+            print(f"⚠️ Connection with {self.sender_addr} appears to be lost (no data received)")
+            # Send ACKs for last received packets to help client
+            if self.expected_seq_num > 1:
+                self.server.send_ack(self.expected_seq_num - 1, self.sender_addr, self.sack_blocks())
+            self.last_nudge_time = now  # Not activity: SESSION_TIMEOUT still counts from the last packet
+
+        # Flush a delayed ACK whose timer has expired
+        if self.ack_deadline is not None and now >= self.ack_deadline:
+            self.flush_ack()
+
+        # Parity of blocks that completed through retransmissions is no longer needed
+        for first_seq, (count, _, _) in list(self.parity_blocks.items()):
+            if first_seq + count <= self.expected_seq_num:
+                del self.parity_blocks[first_seq]
+
+        # Persist the receive bitmap so an interrupted transfer can resume
+        if self.state_dirty and now - self.state_saved_time >= self.server.RESUME_SAVE_INTERVAL:
+            self.save_state()
+
+        # Print status periodically
+        if now - self.last_status_time >= self.server.STATUS_INTERVAL:
+            self.print_status(now)
+            self.last_status_time = now
+
+    def advance(self) -> None:
+        # Move the in-order point past everything already written or skipped
+        while self.expected_seq_num in self.received:
+            leaf = self.pending_leaves.pop(self.expected_seq_num, None)
+            if leaf is None and self.resumed_count and self.expected_seq_num not in self.skipped_packets:
+                # Written before the transfer was interrupted: hash it back from disk
+                chunk = self.load(self.expected_seq_num)
+                leaf = hashlib.blake2b(chunk, digest_size=LEAF_DIGEST_SIZE).digest()
+            if leaf is not None:
+                self.file_digest.update(leaf)
+            self.expected_seq_num += 1
+
+    def handle_control(self, seq_num, data, now) -> bool:
+        # SKIP and EOF frames, flagged in the sequence field so no file content can pass for one.
+        # Returns True once the transfer is complete.
+        self.last_activity_time = now
+        self.packets_received += 1
+        kind = data[0] if len(data) else None
+
+        if kind == CONTROL_SKIP:
+            print(f"⚠️ Client indicates packet {seq_num} should be skipped")
+            self.trace_drop(seq_num, "skipped")
+            self.skipped_packets.add(seq_num)
+            self.received.add(seq_num)
+            self.highest_seq_num = max(self.highest_seq_num, seq_num)
+
+            # If this was the expected packet, move forward past it and anything written after it
+            if seq_num == self.expected_seq_num:
+                self.advance()
+                print(f"⏭️ Advancing expected sequence to {self.expected_seq_num}")
+
+            self.flush_ack()
+            return False
+
+        if kind == CONTROL_EOF:
+            print("🏁 Received EOF signal")
+            # Lost packets the client gave up on, then the client's file digest
+            eof_data = bytes(data[1:]).decode().split(":")
+            if eof_data[0] != "NONE":
+                lost_packets = set(map(int, eof_data[0].split(",")))
+                print(f"ℹ️ Client reported {len(lost_packets)} lost packets: {eof_data[0]}")
+                # Add any reported lost packets to our skip list if not already there
+                for lost_seq in lost_packets:
+                    if lost_seq not in self.skipped_packets:
+                        self.skipped_packets.add(lost_seq)
+            if len(eof_data) > 1:
+                self.verified = eof_data[1] == self.file_digest.hexdigest()
+            self.eof_flags = 0 if self.verified is not False else FLAG_DIGEST_MISMATCH
+            self.server.send_ack(seq_num, self.sender_addr, flags=self.eof_flags)
+            self.acks_sent += 1
+            return True
+
+        self.trace_drop(seq_num, "unknown_control")
+        return False
+
+    def handle_packet(self, seq_num, data, now) -> bool:
+        # Returns True once the transfer is complete. `data` may be a view of the
+        # server's receive buffer, so nothing here may keep a reference to it.
+        self.last_activity_time = now
+        self.packets_received += 1
+        # Out-of-order, duplicate and gap-filling packets are acknowledged immediately
+        # so the client can detect losses from the SACK blocks and fast-retransmit
+        ack_now = seq_num != self.expected_seq_num or self.highest_seq_num > self.expected_seq_num
+
+        # Already processed packet - duplicate
+        if seq_num < self.expected_seq_num or seq_num in self.received:
+            self.duplicate_count += 1
+            if DEVMODE and self.duplicate_count % 10 == 0:  # Don't flood logs
+                print(f"🔁 Duplicate packet received: {seq_num}")
+            self.trace_drop(seq_num, "duplicate")
+            # Our earlier ACK was probably lost, repeat it
+            self.flush_ack()
+            return False
+
+        if (seq_num - self.expected_seq_num) * self.chunk_size > self.server.max_session_memory:
+            # Too far ahead of the in-order point: leave it un-SACKed so the client resends it later
+            self.dropped_count += 1
+            self.trace_drop(seq_num, "exceeds_window")
+            self.flush_ack()
+            return False
+
+        if seq_num > self.expected_seq_num:
+            self.out_of_order_count += 1
+            if DEVMODE and self.out_of_order_count % 10 == 0:  # Reduce log spam
+                print(f"🔄 Out-of-order packet written: {seq_num}")
+
+        # Write the payload where it belongs, whatever order it arrived in
+        if not self.store(seq_num, data):
+            # Not placeable yet (its file's metadata is still missing), the client resends it
+            self.dropped_count += 1
+            self.trace_drop(seq_num, "metadata_missing")
+            self.flush_ack()
+            return False
+        self.received_bytes += len(data)
+        self.received.add(seq_num)
+        self.state_dirty = True
+        self.highest_seq_num = max(self.highest_seq_num, seq_num)
+        leaf = hashlib.blake2b(data, digest_size=LEAF_DIGEST_SIZE).digest()
+        if seq_num == self.expected_seq_num:
+            self.file_digest.update(leaf)
+            self.expected_seq_num += 1
+            self.advance()
+        else:
+            self.pending_leaves[seq_num] = leaf
+
+        # This packet may leave a waiting FEC block with a single hole
+        for first_seq, (count, _, _) in list(self.parity_blocks.items()):
+            if first_seq <= seq_num < first_seq + count and first_seq in self.parity_blocks:
+                self.try_recover(first_seq, now)
+
+        # Acknowledge now or coalesce with the next packets
+        self.unacked_packets += 1
+        if ack_now or self.unacked_packets >= self.server.ACK_EVERY:
+            self.flush_ack()
+        elif self.ack_deadline is None:
+            self.ack_deadline = now + self.server.ACK_DELAY
+        return False
+
+    def trace_drop(self, seq_num, trigger) -> None:
+        if self.server.tracer is not None:
+            self.server.tracer.event("transport:packet_dropped", {"peer": self.server.peer_name(self.sender_addr),
+                                                                   "packet_number": seq_num, "trigger": trigger})
+
+    def metrics_labels(self) -> dict:
+        labels = {"file": os.path.basename(self.file_path), "peer": self.server.peer_name(self.sender_addr)}
+        if self.stripe is not None:
+            labels["stripe"] = self.stripe[0]
+        return labels
+
+    def collect_metrics(self) -> list:
+        labels = self.metrics_labels()
+        return [
+            ("session_packets_received_total", labels, self.packets_received),
+            ("session_bytes_received_total", labels, self.received_bytes),
+            ("session_duplicate_packets_total", labels, self.duplicate_count),
+            ("session_out_of_order_packets_total", labels, self.out_of_order_count),
+            ("session_dropped_packets_total", labels, self.dropped_count),
+            ("session_skipped_packets_total", labels, len(self.skipped_packets)),
+            ("session_recovered_packets_total", labels, self.recovered_count),
+            ("session_acks_sent_total", labels, self.acks_sent),
+            ("session_reorder_buffer_packets", labels, len(self.pending_leaves)),
+            ("session_expected_sequence", labels, self.expected_seq_num),
+        ]
+
+    def print_status(self, now) -> None:
+        elapsed = now - self.start_time
+        speed = self.received_bytes / elapsed / 1024 if elapsed > 0 else 0
+
+        pending = self.highest_seq_num - self.expected_seq_num + 1
+        reorder_status = f"[{self.expected_seq_num}-{self.highest_seq_num}]" if pending > 0 else "in order"
+        skip_info = f"Skipped: {len(self.skipped_packets)}" if self.skipped_packets else ""
+
+        print(f"📊 Status [{os.path.basename(self.file_path)}]: Received {self.received_bytes/1024:.2f} KiB | "
+              f"Speed: {speed:.2f} KiB/s | "
+              f"Expected seq: {self.expected_seq_num} | "
+              f"Reorder window: {reorder_status} | "
+              f"Duplicates: {self.duplicate_count} | {skip_info}")
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            if self.state_dirty:
+                self.save_state(force=True)  # Interrupted: keep what we have for the client's next attempt
+            os.close(self.fd)
+            self.fd = -1
+
+    def finish(self) -> None:
+        if self.stripe is not None:
+            os.ftruncate(self.fd, self.stripe[3])  # Drop leftovers of an older, longer file
+        elif self.file_size is not None:
+            os.ftruncate(self.fd, self.file_size)  # Trim in case the client sent more than announced
+        if self.state_path is not None:
+            self.server.remove_state(self.state_path)
+            self.state_path = None
+        self.close()
+
+        # Calculate elapsed time and speed
+        elapsed = time.time() - self.start_time
+        speed = self.received_bytes / elapsed / 1024 if elapsed > 0 else 0
+
+        # Print transfer summary
+        print(f"\n📈 Transfer Summary for '{os.path.basename(self.file_path)}':")
+        print(f"🔍 BLAKE2b digest: {self.file_digest.hexdigest()}")
+        if self.verified is False:
+            print(f"❌ Integrity check failed: digest does not match the client's, received in {elapsed:.2f} seconds")
+        elif self.verified:
+            print(f"✅ File received and verified in {elapsed:.2f} seconds")
+        else:
+            print(f"✅ File received successfully in {elapsed:.2f} seconds (client sent no digest)")
+        print(f"📊 Size: {self.received_bytes/1024:.2f} KiB, Speed: {speed:.2f} KiB/s")
+        if self.resumed_count:
+            print(f"♻️ Resumed with {self.resumed_count} chunks from an earlier attempt")
+        print(f"📦 Total packets received: {self.packets_received}, ACKs sent: {self.acks_sent}")
+        print(f"🔄 Out-of-order packets: {self.out_of_order_count}")
+        print(f"🔁 Duplicate packets: {self.duplicate_count}")
+        if self.recovered_count:
+            print(f"🧩 Packets recovered from FEC parity: {self.recovered_count}")
+        if self.codec:
+            print(f"🗜️ Compressed packets ({self.codec}): {self.compressed_count}")
+        if self.dropped_count:
+            print(f"🧱 Packets dropped for running ahead: {self.dropped_count}")
+        if self.skipped_packets:
+            print(f"⏭️ Skipped packets: {len(self.skipped_packets)} ({', '.join(map(str, sorted(self.skipped_packets)))})")
+        self.print_destination()
+
+    def print_destination(self) -> None:
+        print(f"🗂️ Saved as: {self.file_path}")
+
+class StreamReceiveSession(ReceiveSession):
+    # Hands the payload to a sink in order instead of writing a file. Packets that arrive ahead
+    # of the in-order point wait in memory, which max_session_memory bounds like any session's
+    # reassembly state, and the last few delivered chunks stay around for FEC recovery.
+    # The sink has write(data), finish(verified) once the EOF arrives and abort(reason) otherwise.
+    RECENT_CHUNKS: int = 64  # Delivered chunks kept for FEC, the client's largest parity block
+
+    def __init__(self, server, name, sender_addr, sink, codec=None, chunk_size=None) -> None:
+        self.sink = sink
+        self.held = {}  # sequence -> payload received ahead of the next delivery
+        self.recent = {}  # sequence -> payload already delivered, for parity recovery
+        self.next_delivery = 1
+        self.completed = False
+        super().__init__(server, name, sender_addr, codec=codec, chunk_size=chunk_size)
+
+    def open_file(self, resuming) -> int:
+        return -1  # Nothing on disk
+
+    def deliver(self) -> None:
+        while True:
+            seq_num = self.next_delivery
+            chunk = self.held.pop(seq_num, None)
+            if chunk is not None:
+                self.sink.write(chunk)
+                self.recent[seq_num] = chunk
+                self.recent.pop(seq_num - self.RECENT_CHUNKS, None)
+            elif seq_num not in self.skipped_packets:
+                return  # A skipped packet leaves a hole in the stream, the digest check reports it
+            self.next_delivery += 1
+
+    def store(self, seq_num, data) -> bool:
+        self.held[seq_num] = bytes(data)
+        self.deliver()
+        return True
+
+    def load(self, seq_num) -> bytes:
+        chunk = self.held.get(seq_num)
+        return chunk if chunk is not None else self.recent.get(seq_num, b"")
+
+    def advance(self) -> None:
+        super().advance()
+        self.deliver()  # A skipped packet may have been all that held delivery back
+
+    def close(self) -> None:
+        if self.sink is not None and not self.completed:
+            self.sink.abort(f"transfer from {self.sender_addr} ended before its EOF")
+            self.sink = None
+        super().close()
+
+    def finish(self) -> None:
+        self.completed = True
+        super().finish()
+        self.sink.finish(self.verified)
+        self.sink = None
+        self.held.clear()
+        self.recent.clear()
+
+    def print_destination(self) -> None:
+        print(f"📤 Delivered to the stream consumer: {self.received_bytes/1024:.2f} KiB")
+
+class TreeEntry:
+    # One file of a multi-file session, its metadata packet sits right before its chunks
+
+    def __init__(self, path, size, meta_seq, chunk_size) -> None:
+        self.path: str | None = path  # None when the client sent a path we refuse to write
+        self.size: int = size
+        self.meta_seq: int = meta_seq
+        self.chunks: int = (size + chunk_size - 1) // chunk_size
+        self.remaining: int = self.chunks  # Chunks not written yet
+        self.fd: int = -1
+
+class TreeReceiveSession(ReceiveSession):
+    # A directory tree or file list received in one session. The client lays the files out back
+    # to back in one sequence space, each one's metadata packet (size, relative path) right
+    # before its chunks, so every sequence number maps to a file and an offset once that
+    # metadata has arrived. Windowing, SACK, FEC and the session digest work as for one file.
+
+    def __init__(self, server, file_path, sender_addr, root_path, file_count, codec=None, chunk_size=None) -> None:
+        self.root_path: str = root_path
+        self.file_count: int = file_count  # Announced in the handshake
+        self.entries = {}  # metadata sequence number -> TreeEntry
+        self.entry_starts = []  # Sorted metadata sequence numbers
+        self.claimed_paths = set()  # Destinations of this session's entries, each may be written once
+        self.files_completed = 0
+        super().__init__(server, file_path, sender_addr, codec=codec, chunk_size=chunk_size)
+
+    def open_file(self, resuming) -> int:
+        return -1  # Every file gets its own descriptor when its metadata arrives
+
+    def resolve(self, relative):
+        # Keep the client inside the receive directory
+        parts = relative.split("/")
+        if not relative or relative.startswith("/") or any(part in ("", ".", "..") for part in parts):
+            return None
+        return os.path.join(self.root_path, *parts)
+
+    def entry_for(self, seq_num):
+        index = bisect.bisect_right(self.entry_starts, seq_num) - 1
+        if index < 0:
+            return None
+        entry = self.entries[self.entry_starts[index]]
+        return entry if seq_num <= entry.meta_seq + entry.chunks else None
+
+    def handle_meta(self, seq_num, data, now) -> bool:
+        if seq_num not in self.entries and len(data) >= ENTRY_HEADER.size:
+            size, = ENTRY_HEADER.unpack_from(data)
+            relative = bytes(data[ENTRY_HEADER.size:]).decode('utf-8', errors='replace')
+            entry = TreeEntry(self.resolve(relative), size, seq_num, self.chunk_size)
+            if entry.path is None:
+                print(f"⚠️ Refusing unsafe path {relative!r} from {self.sender_addr}, discarding its data")
+            elif entry.path in self.claimed_paths:
+                # Reopening it with O_TRUNC would wipe the file an earlier entry just wrote
+                print(f"⚠️ Refusing duplicate path {relative!r} from {self.sender_addr}, discarding its data")
+                entry.path = None
+            else:
+                self.claimed_paths.add(entry.path)
+                if DEVMODE:
+                    print(f"📄 {relative}: {size} bytes")
+                os.makedirs(os.path.dirname(entry.path), exist_ok=True)
+                entry.fd = os.open(entry.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+                self.preallocate(entry.fd, size)
+            self.entries[seq_num] = entry
+            bisect.insort(self.entry_starts, seq_num)
+            if entry.remaining == 0:
+                self.complete(entry)
+        # The metadata packet takes part in windowing and the digest like any other
+        return self.handle_packet(seq_num, data, now)
+
+    def complete(self, entry) -> None:
+        if entry.fd >= 0:
+            os.ftruncate(entry.fd, entry.size)
+            os.close(entry.fd)
+            entry.fd = -1
+        self.files_completed += 1
+
+    def store(self, seq_num, data) -> bool:
+        entry = self.entry_for(seq_num)
+        if entry is None:
+            return False
+        if seq_num == entry.meta_seq:
+            return True  # Registered by handle_meta, nothing to write
+        if entry.fd >= 0:
+            self.write_at((seq_num - entry.meta_seq - 1) * self.chunk_size, data, entry.fd)
+        entry.remaining -= 1
+        if entry.remaining == 0:
+            self.complete(entry)
+        return True
+
+    def load(self, seq_num) -> bytes:
+        # FEC blocks never include metadata packets, and a block with a hole belongs to a file still open
+        entry = self.entry_for(seq_num)
+        if entry is None or entry.fd < 0 or seq_num == entry.meta_seq:
+            return b""
+        return self.read_at((seq_num - entry.meta_seq - 1) * self.chunk_size, self.chunk_size, entry.fd)
+
+    def close(self) -> None:
+        for entry in self.entries.values():
+            if entry.fd >= 0:
+                os.close(entry.fd)
+                entry.fd = -1
+        super().close()
+
+    def finish(self) -> None:
+        super().finish()
+        print(f"🗂️ Files received: {self.files_completed}/{self.file_count} under {self.root_path}")
+
 class TCPficationServer:
-    BUFFER_SIZE: int = 1450  # bytes
+    BUFFER_SIZE: int = 1450  # bytes, default chunk size
+    MIN_CHUNK_SIZE: int = 512  # bytes
+    MAX_CHUNK_SIZE: int = 9000 - 40  # bytes, a 9000-byte jumbo frame minus IPv4, UDP, header and FEC header
+    SOCKET_BUFFER: int = 4 * 1024 * 1024  # bytes requested for SO_RCVBUF / SO_SNDBUF, the kernel may cap it
     TIMEOUT: float = 1.0  # seconds
-    WINDOW_SIZE: int = 10  # Maximum out-of-order packets to buffer
     STATUS_INTERVAL: float = 2.0  # seconds between status updates
     INACTIVITY_TIMEOUT: float = 10.0  # Time to wait before declaring connection lost
+    SESSION_TIMEOUT: float = 60.0  # Time without data before a session is abandoned
+    MAX_SESSIONS: int = 64  # Concurrent transfers, further handshakes are refused
+    MAX_SESSION_MEMORY: int = 64 * 1024 * 1024  # bytes a packet may run ahead of the in-order point, bounds reassembly state
+    MAX_DRAIN: int = 256  # Datagrams read per wakeup before timers get a chance to run
+    ACK_EVERY: int = 8  # Coalesce in-order ACKs: acknowledge every N packets...
+    ACK_DELAY: float = 0.005  # ...or after this many seconds, whichever comes first
+    MAX_SACK_BLOCKS: int = 16  # SACK ranges carried per ACK frame
+    RESUME_SUFFIX: str = ".urft-resume"  # State file kept next to a partial file
+    RESUME_HEADER = struct.Struct("!32sQI")  # file digest sent as the client's file id, file size, chunk size; the bitmap follows
+    RESUME_SAVE_INTERVAL: float = 2.0  # seconds between saves of the receive bitmap
+    MAX_RESUME_BLOCKS: int = 96  # Held ranges returned in the handshake ACK, keeps it under the client's 1 KiB ACK buffer
+    USE_GRO: bool = True  # Let the kernel coalesce consecutive datagrams of a flow (UDP_GRO)
+    GRO_BUFFER_SIZE: int = 65535  # bytes, a coalesced read can hold up to a full UDP datagram
+    UDP_GRO: int = getattr(socket, "UDP_GRO", 104)  # Linux >= 5.0
+    METRICS = (
+        ("packets_received_total", "counter", "Valid datagrams received, probes excluded"),
+        ("bytes_received_total", "counter", "Payload bytes of valid datagrams received"),
+        ("corrupt_packets_total", "counter", "Datagrams dropped for a CRC mismatch or undecodable compression"),
+        ("files_completed_total", "counter", "Transfers completed"),
+        ("sessions_active", "gauge", "Transfers in progress"),
+        ("session_packets_received_total", "counter", "Packets received by a transfer"),
+        ("session_bytes_received_total", "counter", "Payload bytes written by a transfer"),
+        ("session_duplicate_packets_total", "counter", "Packets received again after they were written"),
+        ("session_out_of_order_packets_total", "counter", "Packets written ahead of the in-order point"),
+        ("session_dropped_packets_total", "counter", "Packets refused for running too far ahead"),
+        ("session_skipped_packets_total", "counter", "Packets the client gave up on"),
+        ("session_recovered_packets_total", "counter", "Packets rebuilt from FEC parity"),
+        ("session_acks_sent_total", "counter", "ACKs sent to a transfer's client"),
+        ("session_reorder_buffer_packets", "gauge", "Packets written ahead of the in-order point and not yet hashed"),
+        ("session_expected_sequence", "gauge", "Next in-order sequence number"),
+    )
 
-    def __init__(self, host='0.0.0.0', port=6969) -> None:
+    def __init__(self, host='0.0.0.0', port=6969, max_sessions=None, max_session_memory=None,
+                 reuse_port=False, counters=None, worker_index=0, rcvbuf=None, sndbuf=None, trace=None,
+                 metrics_log=None, metrics_port=None, sink_factory=None) -> None:
         self.host: str = host
         self.port: int = port
+        self.max_sessions: int = max_sessions or self.MAX_SESSIONS
+        self.max_session_memory: int = max_session_memory or self.MAX_SESSION_MEMORY
         self.server_socket: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_socket.settimeout(self.TIMEOUT)  # Set socket timeout for non-blocking recv
+        self.server_socket.setblocking(False)  # All waiting happens in the selector
+        if reuse_port:
+            # Let several worker processes bind the same port, the kernel hashes flows across them
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        # Bursts from many clients land here at once, the default buffer overflows long before the window does
+        self.rcvbuf: int = set_buffer(self.server_socket, socket.SO_RCVBUF, rcvbuf or self.SOCKET_BUFFER)
+        self.sndbuf: int = set_buffer(self.server_socket, socket.SO_SNDBUF, sndbuf or self.SOCKET_BUFFER)
+        self.use_gro: bool = False
+        if self.USE_GRO and sys.platform.startswith("linux"):
+            try:
+                self.server_socket.setsockopt(SOL_UDP, self.UDP_GRO, 1)
+                self.use_gro = True
+            except OSError:
+                pass  # Older kernel, read one datagram per recvfrom
+        max_datagram = HEADER.size + FEC_HEADER.size + self.MAX_CHUNK_SIZE  # A parity packet is the largest
+        self.recv_buffer = bytearray(self.GRO_BUFFER_SIZE if self.use_gro else max_datagram)
+        self.recv_view = memoryview(self.recv_buffer)
+        self.sessions: dict = {}  # sender address -> ReceiveSession
+        self.finished: dict = {}  # sender address -> (EOF sequence number, finish time, EOF flags, handshake), to answer retries
 
-    def start(self) -> None:
-        self.server_socket.bind((self.host, self.port))
-        print(f"🦊 Server listening on {self.host}:{self.port}")
+        # Totals across all sessions, published to the supervisor's shared counters when running as a worker
+        self.packets_received = 0
+        self.bytes_received = 0
+        self.files_completed = 0
+        self.corrupt_packets = 0
+        self.counters = counters
+        self.worker_index: int = worker_index
 
+        # Observability: metrics are read on demand, trace events go through a background writer
+        self.metrics: MetricsRegistry = MetricsRegistry("urft_server")
+        self.metrics.describe(self.METRICS)
+        self.metrics.add_source(self.collect_metrics)
+        self.trace_path: str | None = trace
+        self.tracer: EventTracer | None = None  # Opened in start(), after forking into workers
+        self.metrics_log: MetricsLog | None = MetricsLog(self.metrics, metrics_log) if metrics_log else None
+        self.metrics_port: int | None = metrics_port
+        self.metrics_server: MetricsServer | None = None
+        # Library use: sink_factory(filename, sender_addr) returns a sink for a transfer, or None to write a file
+        self.sink_factory = sink_factory
+        self.state_writer: StateWriter | None = None  # Started with the first resumable transfer
+        self.running: bool = False
+
+    def start(self) -> None:
+        self.bind()
         self.listen()
 
+    def bind(self) -> None:
+        self.server_socket.bind((self.host, self.port))
+        self.port = self.server_socket.getsockname()[1]  # Port 0 picks a free one
+        worker_info = f" (worker {self.worker_index}, pid {os.getpid()})" if self.counters is not None else ""
+        print(f"🦊 Server listening on {self.host}:{self.port}{worker_info}")
+        if self.trace_path:
+            self.tracer = EventTracer(self.trace_path, "server")
+        if self.metrics_port:
+            self.metrics_server = MetricsServer(self.metrics, self.host, self.metrics_port)
+            print(f"📈 Metrics on http://{self.host}:{self.metrics_server.port}/metrics")
+
     def listen(self):
-        while True:
+        selector = selectors.DefaultSelector()
+        selector.register(self.server_socket, selectors.EVENT_READ)
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    now = time.time()
+                    deadline = min((session.next_deadline() for session in self.sessions.values()),
+                                   default=now + self.TIMEOUT)
+                    if selector.select(max(deadline - now, 0)):
+                        self.drain_socket()
+                    self.run_timers(time.time())
+                except Exception as e:
+                    print(f"❌ Error in listen: {e}")
+                    import traceback
+                    traceback.print_exc()
+        finally:
+            selector.close()
+            for session in self.sessions.values():
+                session.close()
+            if self.state_writer is not None:
+                self.state_writer.close()  # Let the last saves reach the disk
+                self.state_writer = None
+            self.close_observability()
+
+    def save_state(self, session, state) -> None:
+        if self.state_writer is None:
+            self.state_writer = StateWriter()
+        self.state_writer.save(session, os.dup(session.fd), session.state_path, state)
+
+    def remove_state(self, state_path) -> None:
+        # After any save still queued for the same file
+        if self.state_writer is not None:
+            self.state_writer.remove(state_path)
+        elif os.path.exists(state_path):
+            os.remove(state_path)
+
+    def stop(self) -> None:
+        # Ask listen() to return, from another thread; it notices at its next wakeup, within seconds
+        self.running = False
+
+    def close_observability(self) -> None:
+        # Flush the metrics log and the trace, stop serving metrics
+        if self.metrics_log is not None:
+            self.metrics_log.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        if self.tracer is not None:
+            self.tracer.close()
+
+    @staticmethod
+    def peer_name(sender_addr) -> str:
+        return f"{sender_addr[0]}:{sender_addr[1]}"
+
+    def collect_metrics(self) -> list:
+        # May run on the metrics server's thread: copy the session table before walking it
+        samples = [
+            ("packets_received_total", {}, self.packets_received),
+            ("bytes_received_total", {}, self.bytes_received),
+            ("corrupt_packets_total", {}, self.corrupt_packets),
+            ("files_completed_total", {}, self.files_completed),
+            ("sessions_active", {}, len(self.sessions)),
+        ]
+        for session in list(self.sessions.values()):
+            samples.extend(session.collect_metrics())
+        return samples
+
+    def drain_socket(self) -> None:
+        # Datagrams land in one reusable buffer; sessions get memoryview slices of it
+        for _ in range(self.MAX_DRAIN):
             try:
-                filename, sender_addr = self.server_socket.recvfrom(TCPficationServer.BUFFER_SIZE)
-                seq_num, filename = struct.unpack("!I", filename[:4])[0], filename[4:].decode().strip()
-                print(f"📩 Receiving file: {filename} from {sender_addr}")
+                if self.use_gro:
+                    nbytes, ancdata, _, sender_addr = self.server_socket.recvmsg_into([self.recv_buffer], socket.CMSG_SPACE(4))
+                else:
+                    nbytes, sender_addr = self.server_socket.recvfrom_into(self.recv_buffer)
+                    ancdata = ()
+            except BlockingIOError:
+                return
+            data = self.recv_view[:nbytes]
 
-                # Send acknowledgment for the filename (multiple times to ensure delivery)
-                for _ in range(3):
-                    self.server_socket.sendto(struct.pack("!I", seq_num), sender_addr)
+            # A GRO read carries several equally sized datagrams back to back
+            segment_size = nbytes
+            for level, kind, value in ancdata:
+                if level == SOL_UDP and kind == self.UDP_GRO:
+                    segment_size = struct.unpack("=i", value[:4])[0]
+            if segment_size >= nbytes:
+                self.handle_datagram(data, sender_addr)
+            else:
+                for offset in range(0, nbytes, segment_size):
+                    self.handle_datagram(data[offset:offset + segment_size], sender_addr)
 
-                file_path = os.path.join(os.getcwd(), filename)
+    def handle_datagram(self, data, sender_addr) -> None:
+        if len(data) < HEADER.size:
+            return
+        seq_num, crc = HEADER.unpack_from(data)
+        data = data[HEADER.size:]
+        if zlib.crc32(data, seq_num) != crc:
+            # Corrupted in flight: drop it, the client resends what we do not acknowledge
+            self.corrupt_packets += 1
+            if DEVMODE:
+                print(f"💥 Checksum mismatch on packet {seq_num} from {sender_addr}")
+            if self.tracer is not None:
+                self.tracer.event("transport:packet_dropped", {"peer": self.peer_name(sender_addr),
+                                                               "packet_number": seq_num & SEQ_MASK,
+                                                               "trigger": "crc_mismatch"})
+            return
+        if seq_num & PROBE_FLAG:
+            # Path MTU probe: arriving at all is the answer
+            self.send_ack(seq_num & SEQ_MASK, sender_addr, flags=FLAG_PROBE)
+            return
+        now = time.time()
+        self.packets_received += 1
+        self.bytes_received += len(data)
+        if self.tracer is not None:
+            self.tracer.event("transport:packet_received", {"peer": self.peer_name(sender_addr),
+                                                            "packet_number": seq_num & SEQ_MASK,
+                                                            "flags": seq_num >> FLAG_SHIFT, "length": len(data)})
 
-                # Process the file transfer
-                self.receive_file(file_path, sender_addr)
-            except socket.timeout:
-                continue  # Keep waiting for connection
+        session = self.sessions.get(sender_addr)
+        if session is not None and seq_num & PARITY_FLAG:
+            session.handle_parity(seq_num & SEQ_MASK, data, now)
+        elif session is not None and seq_num == 0 and data == session.handshake:
+            self.send_handshake_ack(session)  # Our handshake ACKs were lost, the client is retrying
+        elif session is not None and seq_num == 0:
+            # Another transfer from the same socket: the client has given up on this one
+            print(f"♻️ {sender_addr} started a new transfer, abandoning {session.file_path}")
+            session.close()
+            del self.sessions[sender_addr]
+            if self.state_writer is not None:
+                self.state_writer.flush()  # The new session may resume from the state just saved
+            self.open_session(data, sender_addr)
+        elif session is not None:
+            if seq_num & COMPRESSED_FLAG:
+                try:
+                    data = session.decompress(data)
+                except Exception as e:
+                    # Treated like a corrupt packet: dropped, then resent by the client
+                    self.corrupt_packets += 1
+                    if DEVMODE:
+                        print(f"💥 Cannot decompress packet {seq_num & SEQ_MASK} from {sender_addr}: {e}")
+                    if self.tracer is not None:
+                        self.tracer.event("transport:packet_dropped", {"peer": self.peer_name(sender_addr),
+                                                                       "packet_number": seq_num & SEQ_MASK,
+                                                                       "trigger": "decompression_error"})
+                    return
+            control = bool(seq_num & CONTROL_FLAG)
+            meta = bool(seq_num & META_FLAG) and isinstance(session, TreeReceiveSession)
+            seq_num &= SEQ_MASK
+            try:
+                if control:
+                    done = session.handle_control(seq_num, data, now)
+                elif meta:
+                    done = session.handle_meta(seq_num, data, now)
+                else:
+                    done = session.handle_packet(seq_num, data, now)
             except Exception as e:
-                print(f"❌ Error in listen: {e}")
+                print(f"❌ Error during receive from {sender_addr}: {e}")
                 import traceback
                 traceback.print_exc()
+                return
+            if done:
+                del self.sessions[sender_addr]
+                self.finished[sender_addr] = (seq_num, now, session.eof_flags, session.handshake)
+                self.files_completed += 1
+                session.finish()
+        elif seq_num == 0 and sender_addr in self.finished and data == self.finished[sender_addr][3]:
+            # A late or duplicated handshake of a transfer we already completed: opening a
+            # session for it would truncate the verified file, so drop it
+            if DEVMODE:
+                print(f"🔁 Ignoring handshake from {sender_addr}, its transfer already finished")
+            if self.tracer is not None:
+                self.tracer.event("transport:packet_dropped", {"peer": self.peer_name(sender_addr),
+                                                               "packet_number": 0, "trigger": "session_finished"})
+        elif seq_num == 0:
+            self.finished.pop(sender_addr, None)  # The client moved on to its next transfer
+            self.open_session(data, sender_addr)
+        elif (sender_addr in self.finished and seq_num & CONTROL_FLAG
+              and seq_num & SEQ_MASK == self.finished[sender_addr][0]):
+            # Our EOF acknowledgment was lost, the client is retrying
+            self.send_ack(seq_num & SEQ_MASK, sender_addr, flags=self.finished[sender_addr][2])
+
+    def open_session(self, data, sender_addr) -> None:
+        # Handshake payload: filename, then NUL-separated key=value options
+        filename, *options = bytes(data).split(b"\0")
+        filename = os.path.basename(filename.decode().strip())
+        options = dict(option.decode().split("=", 1) for option in options if b"=" in option)
+        file_size = int(options["size"]) if "size" in options else None
+        file_id = options.get("id", "")
+        file_id = bytes.fromhex(file_id) if len(file_id) == 64 else None  # 32-byte BLAKE2b file digest
+        # Take the first codec the client offers that we can decode
+        offered = options.get("compress", "").split(",")
+        codec = next((c for c in offered if c in self.supported_codecs()), None)
+        if len(self.sessions) >= self.max_sessions:
+            print(f"🚫 Refusing {filename} from {sender_addr}: {len(self.sessions)} sessions already active")
+            self.send_ack(0, sender_addr, flags=FLAG_BUSY)
+            return
+
+        tree = int(options["tree"]) if "tree" in options else None
+        chunk_size = max(self.MIN_CHUNK_SIZE, min(int(options.get("chunk", self.BUFFER_SIZE)), self.MAX_CHUNK_SIZE))
+        stripe = None
+        if "stripe" in options and file_size is not None:
+            index, count = map(int, options["stripe"].split("/"))
+            stripe = (index, count, int(options["offset"]), int(options["total"]))
+        file_path = os.path.join(os.getcwd(), filename)
+        for other_addr, other in list(self.sessions.items()):
+            if other.file_path != file_path or (other.stripe and other.stripe[0]) != (stripe and stripe[0]):
+                continue
+            if file_id is not None and other.file_id == file_id and other_addr[0] == sender_addr[0]:
+                # The same resumable transfer restarting after a crash, from a new port
+                print(f"♻️ {filename} was still being received from {other_addr}, closing that session")
+                other.close()
+                del self.sessions[other_addr]
+                if self.state_writer is not None:
+                    self.state_writer.flush()  # The new session resumes from the state it just saved
+                self.send_ack(other.expected_seq_num - 1, other_addr, flags=FLAG_ABORT)
+            else:
+                # Someone else is writing this file: refuse rather than interleave the two
+                print(f"🚫 Refusing {filename} from {sender_addr}: already being received from {other_addr}")
+                self.send_ack(0, sender_addr, flags=FLAG_BUSY | FLAG_ABORT)
+                return
+        if tree is not None:
+            print(f"📩 Receiving {tree} files: {filename} from {sender_addr}")
+        elif stripe is not None:
+            print(f"📩 Receiving file: {filename}, stripe {stripe[0] + 1}/{stripe[1]} from {sender_addr}")
+        else:
+            print(f"📩 Receiving file: {filename} from {sender_addr}")
+        sink = self.sink_factory(filename, sender_addr) if self.sink_factory is not None and tree is None else None
+        if sink is not None:
+            session = StreamReceiveSession(self, filename, sender_addr, sink, codec, chunk_size)
+        elif tree is not None:
+            session = TreeReceiveSession(self, file_path, sender_addr, os.getcwd(), tree, codec, chunk_size)
+        else:
+            session = ReceiveSession(self, file_path, sender_addr, file_size, codec, file_id, stripe, chunk_size)
+        session.handshake = bytes(data)
+        self.sessions[sender_addr] = session
+
+        # Send acknowledgment for the filename (multiple times to ensure delivery)
+        for _ in range(3):
+            self.send_handshake_ack(session)
+
+    def send_handshake_ack(self, session) -> None:
+        # The ACK of sequence 0 carries the options we accepted. A resumable transfer
+        # also lists the chunks already on disk as SACK blocks, so the client skips them.
+        # Our share of the receive buffer caps the client's window
+        accepted = [f"rcvbuf={self.rcvbuf // (len(self.sessions) or 1)}"]
+        if session.chunk_size != self.BUFFER_SIZE:
+            accepted.append(f"chunk={session.chunk_size}")
+        if session.codec:
+            accepted.append(f"compress={session.codec}")
+        if isinstance(session, TreeReceiveSession):
+            accepted.append(f"tree={session.file_count}")
+        held = []
+        if session.file_id is not None:
+            accepted.append(f"resume={session.resumed_count}")
+            held = session.held_ranges(self.MAX_RESUME_BLOCKS)
+        self.send_ack(0, session.sender_addr, held, payload="\0".join(accepted).encode())
+
+    @staticmethod
+    def supported_codecs() -> list:
+        codecs = ["zlib"]
+        if zstandard is not None:
+            codecs.append("zstd")
+        if lz4 is not None:
+            codecs.append("lz4")
+        return codecs
 
-    def receive_file(self, file_path, sender_addr):
-        expected_seq_num = 1
-        buffer = {}
-        duplicate_count = 0
-        out_of_order_count = 0
-        packets_received = 0
-        skipped_packets = set()  # Track packets that were explicitly skipped
+    def run_timers(self, now) -> None:
+        for sender_addr, session in list(self.sessions.items()):
+            if now - session.last_activity_time > self.SESSION_TIMEOUT:
+                print(f"❌ Session with {sender_addr} timed out, abandoning {session.file_path}")
+                session.close()
+                del self.sessions[sender_addr]
+            elif now >= session.next_deadline():
+                session.on_timer(now)
+
+        # Forget finished transfers once their client has certainly given up on EOF retries
+        for sender_addr, (_, finish_time, _, _) in list(self.finished.items()):
+            if now - finish_time > self.SESSION_TIMEOUT:
+                del self.finished[sender_addr]
+
+        if self.metrics_log is not None:
+            self.metrics_log.tick(now)
+
+        if self.counters is not None:
+            # Only this worker writes its slots, so no lock is needed
+            base = self.worker_index * WorkerSupervisor.COUNTERS_PER_WORKER
+            self.counters[base] = self.packets_received
+            self.counters[base + 1] = self.bytes_received
+            self.counters[base + 2] = self.files_completed
+            self.counters[base + 3] = len(self.sessions)
+
+    def send_ack(self, cum_ack, sender_addr, blocks=(), flags=0, payload=b"") -> None:
+        frame = bytearray(ACK_HEADER.pack(cum_ack, flags, len(blocks)))
+        for start, end in blocks:
+            frame += SACK_BLOCK.pack(start, end)
+        frame += payload
+        try:
+            self.server_socket.sendto(frame, sender_addr)
+        except BlockingIOError:
+            pass  # Send buffer full, treat it like a lost ACK
+        if self.tracer is not None:
+            self.tracer.event("transport:packet_sent", {"peer": self.peer_name(sender_addr), "packet_type": "ack",
+                                                        "cumulative_ack": cum_ack, "sack_blocks": list(blocks),
+                                                        "flags": flags})
+
+def run_worker(worker_index, host, port, counters, server_options) -> None:
+    if server_options.get("trace"):
+        server_options = dict(server_options, trace=f"{server_options['trace']}.{worker_index}")  # One trace per worker
+    try:
+        server = TCPficationServer(host, port, reuse_port=True, counters=counters,
+                                   worker_index=worker_index, **server_options)
+        server.start()
+    except KeyboardInterrupt:
+        pass  # The supervisor reports the shutdown
+
+class WorkerSupervisor:
+    # Forks worker processes that each bind the same port with SO_REUSEPORT and run their own
+    # session table, restarts the ones that die and prints throughput aggregated over all of them.
+    # Note that the kernel rehashes flows whenever a worker socket joins or leaves the group,
+    # so a restart can strand transfers that were in progress on other workers too.
+    COUNTERS_PER_WORKER: int = 4  # packets, bytes, files completed, active sessions
+    RESTART_DELAY: float = 1.0  # seconds to wait before restarting a crashed worker
+    METRICS = (
+        ("packets_received_total", "counter", "Valid datagrams received by all workers"),
+        ("bytes_received_total", "counter", "Payload bytes received by all workers"),
+        ("files_completed_total", "counter", "Transfers completed by all workers"),
+        ("sessions_active", "gauge", "Transfers in progress across workers"),
+        ("workers_alive", "gauge", "Worker processes running"),
+        ("worker_restarts_total", "counter", "Workers restarted after exiting"),
+    )
+
+    def __init__(self, host, port, workers, metrics_log=None, metrics_port=None, **server_options) -> None:
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise OSError("SO_REUSEPORT is not supported on this platform, run with a single worker")
+        self.host: str = host
+        self.port: int = port
+        self.workers: int = workers
+        self.server_options: dict = server_options
+        self.counters = multiprocessing.RawArray('Q', workers * self.COUNTERS_PER_WORKER)
+        self.retired = [0] * self.COUNTERS_PER_WORKER  # Totals of workers that exited
+        self.processes: list = [None] * workers
+        self.restarts = 0
+        # Workers keep their sessions to themselves, the supervisor exports the shared totals
+        self.metrics: MetricsRegistry = MetricsRegistry("urft_server")
+        self.metrics.describe(self.METRICS)
+        self.metrics.add_source(self.collect_metrics)
+        self.metrics_log: MetricsLog | None = MetricsLog(self.metrics, metrics_log) if metrics_log else None
+        self.metrics_port: int | None = metrics_port
+
+    def spawn(self, worker_index) -> None:
+        process = multiprocessing.Process(target=run_worker, name=f"urft-worker-{worker_index}",
+                                          args=(worker_index, self.host, self.port,
+                                                self.counters, self.server_options))
+        process.daemon = True
+        process.start()
+        self.processes[worker_index] = process
+
+    def totals(self) -> list:
+        totals = list(self.retired)
+        for worker_index in range(self.workers):
+            base = worker_index * self.COUNTERS_PER_WORKER
+            for i in range(self.COUNTERS_PER_WORKER):
+                totals[i] += self.counters[base + i]
+        totals[3] -= self.retired[3]  # Sessions of dead workers are not active anymore
+        return totals
+
+    def collect_metrics(self) -> list:
+        packets, received, files, active = self.totals()
+        return [
+            ("packets_received_total", {}, packets),
+            ("bytes_received_total", {}, received),
+            ("files_completed_total", {}, files),
+            ("sessions_active", {}, active),
+            ("workers_alive", {}, sum(p is not None and p.is_alive() for p in self.processes)),
+            ("worker_restarts_total", {}, self.restarts),
+        ]
+
+    def start(self) -> None:
+        print(f"🦊 Supervisor starting {self.workers} workers on {self.host}:{self.port}")
+        for worker_index in range(self.workers):
+            self.spawn(worker_index)
+        metrics_server = None
+        if self.metrics_port:
+            metrics_server = MetricsServer(self.metrics, self.host, self.metrics_port)
+            print(f"📈 Metrics on http://{self.host}:{metrics_server.port}/metrics")
 
         start_time = time.time()
-        last_status_time = start_time
-        last_activity_time = start_time
-        received_bytes = 0
-        
-        with open(file_path, "wb") as file:
+        last_bytes = 0
+        last_time = start_time
+        try:
             while True:
-                try:
-                    # Check for inactivity timeout
-                    current_time = time.time()
-                    if current_time - last_activity_time > self.INACTIVITY_TIMEOUT:
-                        print("⚠️ Connection appears to be lost (no data received)")
-                        # Send ACKs for last received packets to help client
-                        if expected_seq_num > 1:
-                            self.server_socket.sendto(struct.pack("!I", expected_seq_num-1), sender_addr)
-                        last_activity_time = current_time
-                    
-                    # Receive data
-                    data, addr = self.server_socket.recvfrom(self.BUFFER_SIZE + 4)
-                    last_activity_time = time.time()
-                    packets_received += 1
-                    
-                    seq_num, data = struct.unpack("!I", data[:4])[0], data[4:]
-
-                    # Always acknowledge the received packet (multiple times for important packets)
-                    send_count = 3 if (seq_num == expected_seq_num or b"EOF:" in data or data == b"SKIP_PACKET") else 1
-                    for _ in range(send_count):
-                        self.server_socket.sendto(struct.pack("!I", seq_num), sender_addr)
-
-                    # Handle SKIP_PACKET marker
-                    if data == b"SKIP_PACKET":
-                        print(f"⚠️ Client indicates packet {seq_num} should be skipped")
-                        skipped_packets.add(seq_num)
-                        
-                        # If this was the expected packet, move forward
-                        if seq_num == expected_seq_num:
-                            expected_seq_num += 1
-                            print(f"⏭️ Advancing expected sequence to {expected_seq_num}")
-                            
-                            # Process any buffered packets that come after the skip
-                            while expected_seq_num in buffer:
-                                file.write(buffer[expected_seq_num])
-                                received_bytes += len(buffer[expected_seq_num])
-                                del buffer[expected_seq_num]
-                                expected_seq_num += 1
-                            
-                        continue
-
-                    # Check if this is EOF packet
-                    if b"EOF:" in data:
-                        print("🏁 Received EOF signal")
-                        # Check if EOF contains lost packet information
-                        eof_data = data.decode().split(":")
-                        if len(eof_data) > 1 and eof_data[1] != "NONE":
-                            lost_packets = set(map(int, eof_data[1].split(",")))
-                            print(f"ℹ️ Client reported {len(lost_packets)} lost packets: {eof_data[1]}")
-                            # Add any reported lost packets to our skip list if not already there
-                            for lost_seq in lost_packets:
-                                if lost_seq not in skipped_packets:
-                                    skipped_packets.add(lost_seq)
-                        break
+                time.sleep(TCPficationServer.STATUS_INTERVAL)
+                for worker_index, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        print(f"⚠️ Worker {worker_index} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                        # Fold its counters into the retired totals before the new worker reuses the slots
+                        base = worker_index * self.COUNTERS_PER_WORKER
+                        for i in range(self.COUNTERS_PER_WORKER):
+                            self.retired[i] += self.counters[base + i]
+                            self.counters[base + i] = 0
+                        time.sleep(self.RESTART_DELAY)
+                        self.spawn(worker_index)
+                        self.restarts += 1
 
-                    # Already processed packet - duplicate
-                    if seq_num < expected_seq_num or seq_num in skipped_packets:
-                        duplicate_count += 1
-                        if DEVMODE and duplicate_count % 10 == 0:  # Don't flood logs
-                            print(f"🔁 Duplicate packet received: {seq_num}")
-                        continue
-
-                    # In-order packet - process immediately
-                    if seq_num == expected_seq_num:
-                        file.write(data)
-                        received_bytes += len(data)
-                        expected_seq_num += 1
-
-                        # Check if we have buffered packets that can now be processed
-                        while expected_seq_num in buffer:
-                            file.write(buffer[expected_seq_num])
-                            received_bytes += len(buffer[expected_seq_num])
-                            del buffer[expected_seq_num]
-                            expected_seq_num += 1
-                            
-                        # Check if the next expected is in our skip list
-                        while expected_seq_num in skipped_packets:
-                            print(f"⏭️ Skipping previously marked packet {expected_seq_num}")
-                            expected_seq_num += 1
-                    
-                    # Out-of-order packet - buffer it
-                    elif seq_num > expected_seq_num:
-                        out_of_order_count += 1
-                        # Only store if we don't already have this packet
-                        if seq_num not in buffer and seq_num not in skipped_packets:
-                            buffer[seq_num] = data
-                            if DEVMODE and out_of_order_count % 10 == 0:  # Reduce log spam
-                                print(f"🔄 Out-of-order packet buffered: {seq_num}")
-                    
-                    # Print status periodically
-                    current_time = time.time()
-                    if current_time - last_status_time >= self.STATUS_INTERVAL:
-                        elapsed = current_time - start_time
-                        speed = received_bytes / elapsed / 1024 if elapsed > 0 else 0
-                        
-                        buffer_status = f"{len(buffer)} packets"
-                        if len(buffer) > 0:
-                            buffer_min = min(buffer.keys()) if buffer else 'N/A'
-                            buffer_max = max(buffer.keys()) if buffer else 'N/A'
-                            buffer_status += f" [{buffer_min}-{buffer_max}]"
-                        
-                        skip_info = f"Skipped: {len(skipped_packets)}" if skipped_packets else ""
-                        
-                        print(f"📊 Status: Received {received_bytes/1024:.2f} KiB | "
-                              f"Speed: {speed:.2f} KiB/s | "
-                              f"Expected seq: {expected_seq_num} | "
-                              f"Buffer: {buffer_status} | "
-                              f"Duplicates: {duplicate_count} | {skip_info}")
-                        
-                        last_status_time = current_time
-                            
-                except socket.timeout:
-                    # Socket timeout is normal - just continue
-                    continue
-                except Exception as e:
-                    print(f"❌ Error during receive: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    continue
-
-        # Calculate elapsed time and speed
-        elapsed = time.time() - start_time
-        speed = received_bytes / elapsed / 1024 if elapsed > 0 else 0
-        
-        # Calculate file checksum
-        md5_hash = hashlib.md5()
-        with open(file_path, 'rb') as file:
-            for chunk in iter(lambda: file.read(self.BUFFER_SIZE), b''):
-                md5_hash.update(chunk)
-        checksum = md5_hash.hexdigest()
-        
-        # Print transfer summary
-        print(f"\n📈 Transfer Summary for '{os.path.basename(file_path)}':")
-        print(f"🔍 MD5 Checksum: {checksum}")
-        print(f"✅ File received successfully in {elapsed:.2f} seconds")
-        print(f"📊 Size: {received_bytes/1024:.2f} KiB, Speed: {speed:.2f} KiB/s")
-        print(f"📦 Total packets received: {packets_received}")
-        print(f"🔄 Out-of-order packets: {out_of_order_count}")
-        print(f"🔁 Duplicate packets: {duplicate_count}")
-        if skipped_packets:
-            print(f"⏭️ Skipped packets: {len(skipped_packets)} ({', '.join(map(str, sorted(skipped_packets)))})")
-        print(f"🗂️ Saved as: {file_path}")
-        exit(0)
+                packets, received, files, active = self.totals()
+                now = time.time()
+                speed = (received - last_bytes) / (now - last_time) / 1024 if now > last_time else 0
+                if received != last_bytes or active:
+                    print(f"📊 Workers: {sum(p.is_alive() for p in self.processes)}/{self.workers} | "
+                          f"Sessions: {active} | "
+                          f"Received {received/1024:.2f} KiB in {packets} packets | "
+                          f"Speed: {speed:.2f} KiB/s | "
+                          f"Files: {files} | Restarts: {self.restarts}")
+                last_bytes, last_time = received, now
+                if self.metrics_log is not None:
+                    self.metrics_log.tick(now)
+        finally:
+            if self.metrics_log is not None:
+                self.metrics_log.close()
+            if metrics_server is not None:
+                metrics_server.close()
+            for process in self.processes:
+                if process is not None and process.is_alive():
+                    process.terminate()
+            for process in self.processes:
+                if process is not None:
+                    process.join()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage="python urft_server.py [<server_ip> <server_port>] [options]")
+    parser.add_argument("host", nargs="?", default='0.0.0.0')
+    parser.add_argument("port", nargs="?", type=int, default=6969)
+    parser.add_argument("--max-sessions", type=int, default=TCPficationServer.MAX_SESSIONS,
+                        help="Concurrent transfers accepted (default: %(default)s)")
+    parser.add_argument("--max-session-memory", type=int, default=TCPficationServer.MAX_SESSION_MEMORY,
+                        help="Bytes a packet may run ahead of the in-order point per transfer (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes sharing the port with SO_REUSEPORT (default: %(default)s)")
+    parser.add_argument("--rcvbuf", type=int, default=TCPficationServer.SOCKET_BUFFER,
+                        help="Socket receive buffer size in bytes, advertised to clients (default: %(default)s)")
+    parser.add_argument("--sndbuf", type=int, default=TCPficationServer.SOCKET_BUFFER,
+                        help="Socket send buffer size in bytes (default: %(default)s)")
+    parser.add_argument("--qlog", metavar="PATH",
+                        help="Write a qlog (JSON-SEQ) trace of every packet event to PATH (PATH.N per worker)")
+    parser.add_argument("--metrics-log", metavar="PATH",
+                        help=f"Append a JSON snapshot of the metrics to PATH every {MetricsLog.INTERVAL:g} seconds")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve Prometheus metrics on http://<server_ip>:PORT/metrics")
+    args = parser.parse_args()
+
     try:
-        host = '0.0.0.0'
-        port = 6969
-        
-        if len(sys.argv) > 2:
-            host = sys.argv[1]
-            port = int(sys.argv[2])
-            
-        server = TCPficationServer(host, port)
-        server.start()
+        if args.workers > 1:
+            supervisor = WorkerSupervisor(args.host, args.port, args.workers, max_sessions=args.max_sessions,
+                                          max_session_memory=args.max_session_memory,
+                                          rcvbuf=args.rcvbuf, sndbuf=args.sndbuf, trace=args.qlog,
+                                          metrics_log=args.metrics_log, metrics_port=args.metrics_port)
+            supervisor.start()
+        else:
+            server = TCPficationServer(args.host, args.port, args.max_sessions, args.max_session_memory,
+                                       rcvbuf=args.rcvbuf, sndbuf=args.sndbuf, trace=args.qlog,
+                                       metrics_log=args.metrics_log, metrics_port=args.metrics_port)
+            server.start()
     except KeyboardInterrupt:
-        print("🦊 Server shutting down...")
\ No newline at end of file
+        print("🦊 Server shutting down...")